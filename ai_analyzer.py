@@ -5,10 +5,16 @@ AI 分析核心模組 - 修正版（參考 Streamlit 成功版本）
 import os
 import sys
 import json
-from datetime import datetime, timedelta
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
+import numpy as np
 import pandas as pd
 
+# AI 回應快取的鍵與效期與 Streamlit 頁面共用；每次排程都是全新的執行環境，快取放在資料庫才能跨次執行沿用
+from ai_cache import AI_CACHE_TABLE, cache_key, cache_expires_at
+
 # 嘗試導入 google-generativeai
 try:
     import google.generativeai as genai
@@ -42,13 +48,51 @@ except ImportError:
     
     StockPrompts = SimplePrompts
 
+# 無法載入 prompts.py 時的個股提示詞（模組層級的 % 格式字串，不必每檔重新組 f-string）
+_FALLBACK_INDIVIDUAL_TMPL = """
+請分析以下漲停股票：
+股票名稱：%(name)s
+股票代碼：%(symbol)s
+產業：%(sector)s
+價格：%(price)s
+漲幅：%(return_pct).2f%%
+連續漲停天數：%(consecutive_days)s
+
+請提供技術面、基本面、風險評估和操作建議。
+"""
+
+# 快速路徑的固定點評：首日漲停、同產業沒有其他漲停股時，AI 多半只會產出制式內容，直接套用不呼叫模型
+_FAST_PATH_INDIVIDUAL_TMPL = (
+    "%(name)s(%(symbol)s) 今日首度漲停（漲幅 %(return_pct).2f%%），"
+    "所屬產業「%(sector)s」無其他個股同步漲停，屬個股題材表態；"
+    "留意明日能否續強與量能變化，追價宜控管風險。"
+)
+
+# 語意快取（見 sql/ai_semantic_cache.sql）：數字小幅變動但分析結論相同的產業/市場提示詞
+# 個股分析太具體，不做語意比對；比對範圍限定同一 scope（產業名稱 / 市場總結的日期），
+# 否則模板相同的不同產業提示詞會互相命中
+AI_SEMANTIC_CACHE_TABLE = "ai_semantic_cache"
+AI_SEMANTIC_KINDS = ('sector', 'market')
+# 每次比對最多取回的候選筆數（每筆都帶整組向量，取最新的幾筆即可）
+AI_SEMANTIC_CANDIDATES = 20
+EMBEDDING_MODEL = "models/text-embedding-004"
+
 class StockAIAnalyzer:
     """股票AI分析器"""
     
-    def __init__(self, api_key: str, supabase_client=None):
-        """初始化AI分析器 - 參考 Streamlit 的成功設定"""
+    def __init__(self, api_key: str, supabase_client=None, semantic_threshold: float = 0.0,
+                 fast_path: bool = False):
+        """
+        初始化AI分析器 - 參考 Streamlit 的成功設定
+        semantic_threshold: 語意快取的餘弦相似度門檻，0 表示停用
+        fast_path: 首日且非族群漲停的個股改用固定點評，不呼叫模型
+        """
         self.supabase = supabase_client
         self.analyzed_cache = {}
+        self.semantic_threshold = semantic_threshold
+        self.fast_path = fast_path
+        # 每個執行緒各自記錄最近一次分析是否真的呼叫了模型（快取命中、快速路徑都不算）
+        self._local = threading.local()
         
         # 檢查Gemini是否可用
         if not GEMINI_AVAILABLE:
@@ -107,10 +151,123 @@ class StockAIAnalyzer:
             print(f"❌ AI分析器初始化失敗: {str(e)[:200]}")
             self.model = None
     
+    def model_called(self) -> bool:
+        """本執行緒最近一次分析是否真的呼叫了 Gemini，呼叫端據此決定要不要冷卻"""
+        return getattr(self._local, 'model_called', False)
+    
     def is_available(self):
         """檢查AI分析器是否可用"""
         return self.model is not None and GEMINI_AVAILABLE
     
+    def _cache_key(self, prompt: str) -> str:
+        return cache_key(prompt, getattr(self.model, 'model_name', ''))
+    
+    def _read_response_cache(self, key: str) -> Optional[str]:
+        if not self.supabase:
+            return None
+        try:
+            response = self.supabase.table(AI_CACHE_TABLE).select("response")\
+                .eq("hash", key)\
+                .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+                .limit(1)\
+                .execute()
+            if response.data:
+                return response.data[0]['response']
+        except Exception as e:
+            print(f"讀取AI快取失敗: {str(e)[:100]}")
+        return None
+    
+    def _write_response_cache(self, key: str, kind: str, text: str):
+        if not self.supabase:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            self.supabase.table(AI_CACHE_TABLE).upsert({
+                "hash": key,
+                "response": text,
+                "created_at": now.isoformat(),
+                "expires_at": cache_expires_at(kind, now).isoformat()
+            }).execute()
+        except Exception as e:
+            print(f"寫入AI快取失敗: {str(e)[:100]}")
+    
+    def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        try:
+            result = genai.embed_content(model=EMBEDDING_MODEL, content=prompt)
+            return np.asarray(result['embedding'], dtype=np.float32)
+        except Exception as e:
+            print(f"提示詞向量化失敗: {str(e)[:100]}")
+            return None
+    
+    def _read_semantic_cache(self, kind: str, scope: str, embedding: np.ndarray) -> Optional[str]:
+        """在同類型、同模型、同 scope 且未過期的最新幾筆快取中找最相似的提示詞，達門檻才回傳其回應"""
+        try:
+            response = self.supabase.table(AI_SEMANTIC_CACHE_TABLE).select("embedding, response")\
+                .eq("kind", kind)\
+                .eq("model", getattr(self.model, 'model_name', ''))\
+                .eq("scope", scope)\
+                .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+                .order("created_at", desc=True)\
+                .limit(AI_SEMANTIC_CANDIDATES)\
+                .execute()
+        except Exception as e:
+            print(f"讀取語意快取失敗: {str(e)[:100]}")
+            return None
+        rows = [r for r in (response.data or []) if len(r['embedding']) == len(embedding)]
+        if not rows:
+            return None
+        
+        matrix = np.asarray([r['embedding'] for r in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(embedding)
+        sims = matrix @ embedding / np.where(norms == 0, 1, norms)
+        best = int(np.argmax(sims))
+        if sims[best] >= self.semantic_threshold:
+            return rows[best]['response']
+        return None
+    
+    def _write_semantic_cache(self, kind: str, scope: str, embedding: np.ndarray, text: str):
+        now = datetime.now(timezone.utc)
+        try:
+            self.supabase.table(AI_SEMANTIC_CACHE_TABLE).insert({
+                "kind": kind,
+                "scope": scope,
+                "model": getattr(self.model, 'model_name', ''),
+                "embedding": embedding.tolist(),
+                "response": text,
+                "created_at": now.isoformat(),
+                "expires_at": cache_expires_at(kind, now).isoformat()
+            }).execute()
+        except Exception as e:
+            print(f"寫入語意快取失敗: {str(e)[:100]}")
+    
+    def _generate(self, kind: str, prompt: str, scope: str = '') -> str:
+        """
+        呼叫 Gemini 產生分析；相同模型與提示詞在 TTL 內直接沿用資料庫快取
+        產業/市場分析在完全相同未命中時，再以向量相似度找同 scope 內近似的提示詞
+        kind: 'individual' / 'sector' / 'market'，決定快取有效時間
+        scope: 語意比對的範圍（產業名稱 / 日期）
+        """
+        key = self._cache_key(prompt)
+        cached = self._read_response_cache(key)
+        if cached:
+            return cached
+        
+        embedding = None
+        if self.supabase and self.semantic_threshold > 0 and kind in AI_SEMANTIC_KINDS:
+            embedding = self._embed(prompt)
+            if embedding is not None:
+                cached = self._read_semantic_cache(kind, scope, embedding)
+                if cached:
+                    return cached
+        
+        self._local.model_called = True
+        text = self.model.generate_content(prompt).text
+        if text:
+            self._write_response_cache(key, kind, text)
+            if embedding is not None:
+                self._write_semantic_cache(kind, scope, embedding, text)
+        return text
+    
     def get_consecutive_limit_up_days(self, symbol: str) -> Dict:
         """
         查詢連續漲停天數
@@ -120,12 +277,13 @@ class StockAIAnalyzer:
             return {'consecutive_days': 1, 'recent_history': []}
         
         try:
-            # 查詢最近5天的記錄
-            today = datetime.now().strftime("%Y-%m-%d")
-            five_days_ago = (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d")
+            # 查詢最近5天的記錄（只取一次時間）
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
+            five_days_ago = (now - timedelta(days=5)).strftime("%Y-%m-%d")
             
             response = self.supabase.table("individual_stock_analysis")\
-                .select("*")\
+                .select("analysis_date, return_rate, is_rotc")\
                 .eq("symbol", symbol)\
                 .gte("analysis_date", five_days_ago)\
                 .lte("analysis_date", today)\
@@ -135,30 +293,17 @@ class StockAIAnalyzer:
             if not response.data:
                 return {'consecutive_days': 1, 'recent_history': []}
             
-            # 找出連續漲停天數
-            consecutive_days = 0
-            recent_history = []
-            
-            for record in response.data:
-                return_rate = record.get('return_rate')
-                is_rotc = record.get('is_rotc', False)
-                threshold = 0.10 if is_rotc else 0.098
-                
-                # 檢查 return_rate 是否為 None
-                if return_rate is None:
-                    break
-                
-                try:
-                    if float(return_rate) >= threshold:
-                        consecutive_days += 1
-                        recent_history.append({
-                            'date': record['analysis_date'],
-                            'return': return_rate
-                        })
-                    else:
-                        break
-                except (ValueError, TypeError):
-                    break
+            # 找出連續漲停天數（一次轉成 float 陣列比較，None / 無法轉換的值視為中斷）
+            records = response.data
+            rates = pd.to_numeric(pd.Series([r.get('return_rate') for r in records], dtype=object),
+                                  errors='coerce').to_numpy(dtype=np.float64)
+            thresholds = np.where([bool(r.get('is_rotc', False)) for r in records], 0.10, 0.098)
+            hits = rates >= thresholds
+            consecutive_days = len(hits) if hits.all() else int(np.argmin(hits))
+            recent_history = [
+                {'date': r['analysis_date'], 'return': r['return_rate']}
+                for r in records[:consecutive_days]
+            ]
             
             return {
                 'consecutive_days': consecutive_days or 1,
@@ -169,11 +314,13 @@ class StockAIAnalyzer:
             print(f"查詢連續漲停失敗 {symbol}: {e}")
             return {'consecutive_days': 1, 'recent_history': []}
     
-    def analyze_individual_stock(self, stock_info: Dict) -> Optional[str]:
+    def analyze_individual_stock(self, stock_info: Dict, persist: bool = True) -> Optional[str]:
         """
         分析單一漲停股票
+        persist: 是否由分析器直接把點評寫回資料庫；呼叫端會自行以完整資料列寫入時傳 False
         Returns: AI分析結果
         """
+        self._local.model_called = False
         if not self.is_available():
             return None
             
@@ -195,6 +342,19 @@ class StockAIAnalyzer:
                 'recent_history': []
             }
         
+        # 快速路徑：首日漲停，且呼叫端已依完整掃描結果確認不是族群行情
+        if self.fast_path and stock_info['consecutive_days'] <= 1 and stock_info.get('is_hot_sector') is False:
+            analysis = _FAST_PATH_INDIVIDUAL_TMPL % {
+                'name': stock_info.get('name', 'N/A'),
+                'symbol': symbol,
+                'sector': stock_info.get('sector', '未分類'),
+                'return_pct': stock_info.get('return', 0) * 100,
+            }
+            self.analyzed_cache[cache_key] = analysis
+            if persist:
+                self._update_stock_analysis(symbol, analysis)
+            return analysis
+        
         # 生成提示詞
         if PROMPTS_AVAILABLE:
             prompt = StockPrompts.get_individual_stock_prompt(
@@ -204,28 +364,25 @@ class StockAIAnalyzer:
             )
         else:
             # 預設提示詞
-            prompt = f"""
-            請分析以下漲停股票：
-            股票名稱：{stock_info.get('name', 'N/A')}
-            股票代碼：{stock_info.get('symbol', 'N/A')}
-            產業：{stock_info.get('sector', '未分類')}
-            價格：{stock_info.get('price', 'N/A')}
-            漲幅：{stock_info.get('return', 0):.2%}
-            連續漲停天數：{stock_info.get('consecutive_days', 1)}
-            
-            請提供技術面、基本面、風險評估和操作建議。
-            """
+            prompt = _FALLBACK_INDIVIDUAL_TMPL % {
+                'name': stock_info.get('name', 'N/A'),
+                'symbol': stock_info.get('symbol', 'N/A'),
+                'sector': stock_info.get('sector', '未分類'),
+                'price': stock_info.get('price', 'N/A'),
+                'return_pct': stock_info.get('return', 0) * 100,
+                'consecutive_days': stock_info.get('consecutive_days', 1),
+            }
         
         # 呼叫AI
         try:
-            response = self.model.generate_content(prompt)
-            analysis = response.text
+            analysis = self._generate('individual', prompt)
             
             # 存入快取
             self.analyzed_cache[cache_key] = analysis
             
             # 更新資料庫
-            self._update_stock_analysis(symbol, analysis)
+            if persist:
+                self._update_stock_analysis(symbol, analysis)
             
             return analysis
             
@@ -281,8 +438,7 @@ class StockAIAnalyzer:
         
         # 呼叫AI
         try:
-            response = self.model.generate_content(prompt)
-            analysis = response.text
+            analysis = self._generate('sector', prompt, scope=sector_name)
             
             # 存入快取
             self.analyzed_cache[cache_key] = analysis
@@ -305,10 +461,7 @@ class StockAIAnalyzer:
             return None
             
         # 統計產業分布
-        sector_distribution = {}
-        for stock in all_stocks:
-            sector = stock.get('sector', '其他')
-            sector_distribution[sector] = sector_distribution.get(sector, 0) + 1
+        sector_distribution = Counter(stock.get('sector', '其他') for stock in all_stocks)
         
         # 市場指標（可擴充）
         market_indicators = {
@@ -341,8 +494,7 @@ class StockAIAnalyzer:
         
         # 呼叫AI
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self._generate('market', prompt, scope=datetime.now().strftime('%Y-%m-%d'))
         except Exception as e:
             print(f"市場AI分析失敗: {str(e)[:100]}")
             return None
@@ -370,7 +522,8 @@ class StockAIAnalyzer:
             return
         
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
             stock_symbols = [s['symbol'] for s in stocks]
             
             data = {
@@ -379,7 +532,7 @@ class StockAIAnalyzer:
                 "stock_count": len(stocks),
                 "stocks_included": json.dumps(stock_symbols),
                 "ai_analysis": analysis,
-                "created_at": datetime.now().isoformat()
+                "created_at": now.isoformat()
             }
             
             self.supabase.table("sector_analysis").upsert(data).execute()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+AI 回應快取的鍵與效期：監控程式（ai_analyzer.py）與 Streamlit 頁面（utils/ai.py）
+共用 Supabase 的 ai_response_cache 表（見 sql/ai_response_cache.sql），兩邊都從這裡算鍵與過期時間
+本模組不依賴 streamlit，排程環境也能匯入
+"""
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone, time as dt_time
+
+AI_CACHE_TABLE = "ai_response_cache"
+# 提示詞模板版本：修改 prompts.py 或頁面上的提示詞模板時遞增，舊的快取回應即全部失效
+PROMPT_VERSION = 1
+# 盤中的快取效期：個股還在交易、變化最快；非盤中的回應一律保留到下個交易日開盤（見 cache_ttl_for）
+AI_CACHE_TTL = {
+    'individual': timedelta(minutes=10),
+    'sector': timedelta(minutes=30),
+    'market': timedelta(hours=4),
+}
+# 台股交易時段（台北時間）
+TW_TZ = timezone(timedelta(hours=8))
+MARKET_OPEN = dt_time(9, 0)
+MARKET_CLOSE = dt_time(13, 30)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """把連續空白壓成單一空格，讓只差縮排或換行的提示詞共用同一個快取鍵"""
+    return re.sub(r'\s+', ' ', prompt.strip())
+
+
+def normalize_model_name(model_name: str) -> str:
+    """統一成 models/ 前綴（GenerativeModel.model_name 的格式），設定檔寫法不同也得到同一個鍵"""
+    if model_name and not model_name.startswith('models/'):
+        return f"models/{model_name}"
+    return model_name or ''
+
+
+def cache_key(prompt: str, model_name: str) -> str:
+    """模型名稱 + 模板版本 + 正規化後提示詞的 SHA-256（送給 AI 的仍是原文）"""
+    key = f"{normalize_model_name(model_name)}\x00{PROMPT_VERSION}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def cache_ttl_for(kind: str, now: datetime) -> timedelta:
+    """依台股交易時段決定快取效期：盤中用 AI_CACHE_TTL，其餘時間到下個交易日 09:00 為止"""
+    local = now.astimezone(TW_TZ)
+    is_weekday = local.weekday() < 5
+    if is_weekday and MARKET_OPEN <= local.time() < MARKET_CLOSE:
+        return AI_CACHE_TTL[kind]
+    next_open = datetime.combine(local.date(), MARKET_OPEN, tzinfo=TW_TZ)
+    if not is_weekday or local.time() >= MARKET_CLOSE:
+        next_open += timedelta(days=1)
+    while next_open.weekday() >= 5:
+        next_open += timedelta(days=1)
+    return next_open - local
+
+
+def cache_expires_at(kind: str, now: datetime) -> datetime:
+    """寫入快取時的 expires_at（now 需帶時區）"""
+    return now + cache_ttl_for(kind, now)
@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 from logger import log
 
 class AIService:
@@ -10,6 +14,12 @@ class AIService:
         self.enable_sector = bool(cfg.get("ENABLE_AI_SECTOR"))
         self.enable_market = bool(cfg.get("ENABLE_AI_MARKET"))
 
+        # 個股 AI 並行數；每個執行緒呼叫後各自冷卻，實際速率約為 並行數 / 冷卻秒數
+        self.max_concurrency = max(1, int(cfg.get("AI_MAX_CONCURRENCY", 1)))
+        self.cooldown_min = float(cfg.get("AI_COOLDOWN_MIN", 6.0))
+        self.cooldown_max = float(cfg.get("AI_COOLDOWN_MAX", 9.0))
+        self.fast_path = bool(cfg.get("AI_FAST_PATH"))
+
         self._analyzer = None
 
         gemini_key = cfg.get("GEMINI_API_KEY")
@@ -18,7 +28,12 @@ class AIService:
 
         try:
             from ai_analyzer import StockAIAnalyzer
-            self._analyzer = StockAIAnalyzer(gemini_key, db_repo.client if db_repo else None)
+            self._analyzer = StockAIAnalyzer(
+                gemini_key,
+                db_repo.client if db_repo else None,
+                semantic_threshold=float(cfg.get("AI_SEMANTIC_THRESHOLD", 0.0)),
+                fast_path=self.fast_path,
+            )
             if hasattr(self._analyzer, "is_available") and not self._analyzer.is_available():
                 log("⚠️ AI分析器部分功能不可用")
                 self._analyzer = None
@@ -31,15 +46,34 @@ class AIService:
     def is_ready(self) -> bool:
         return self._analyzer is not None
 
-    def analyze_individual(self, info: dict) -> str | None:
-        if not self.is_ready():
-            return None
+    def _analyze_individual(self, info: dict) -> str | None:
         try:
-            return self._analyzer.analyze_individual_stock(info)
+            # 批次呼叫端會把點評連同整列資料一次寫回，分析器不另外更新
+            return self._analyzer.analyze_individual_stock(info, persist=False)
         except Exception as e:
             log(f"⚠️ 個股 AI 失敗 {info.get('symbol')}: {str(e)[:80]}")
             return None
 
+    def _analyze_individual_paced(self, info: dict) -> str | None:
+        res = self._analyze_individual(info)
+        # ✅ 只有真的打 AI 才冷卻（快取命中、快速路徑不冷卻）
+        if self._analyzer.model_called():
+            time.sleep(random.uniform(self.cooldown_min, self.cooldown_max))
+        return res
+
+    def analyze_individual_batch(self, infos: list[dict]) -> dict[str, str | None]:
+        """
+        一次分析多檔個股：Gemini 呼叫是網路 I/O，以最多 max_concurrency 個執行緒同時送出
+        回傳 {symbol: 分析結果}；max_concurrency=1 時與逐檔呼叫相同
+        點評不在這裡寫回資料庫，由呼叫端連同整列資料一次 upsert
+        """
+        if not self.is_ready() or not infos:
+            return {}
+        workers = min(self.max_concurrency, len(infos))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self._analyze_individual_paced, infos))
+        return {info["symbol"]: res for info, res in zip(infos, results)}
+
     def analyze_sector(self, sector: str, stocks_in_sector: list[dict]) -> str | None:
         if not self.is_ready():
             return None
@@ -76,6 +76,16 @@ class Config:
     AI_SECTOR_COOLDOWN_MIN = _env_float("AI_SECTOR_COOLDOWN_MIN", 12.0)
     AI_SECTOR_COOLDOWN_MAX = _env_float("AI_SECTOR_COOLDOWN_MAX", 15.0)
 
+    # 個股 AI 同時送出的請求數（免費額度維持 1；付費額度可調高）
+    AI_MAX_CONCURRENCY = _env_int("AI_MAX_CONCURRENCY", 1)
+
+    # 產業/市場 AI 語意快取的相似度門檻（0 = 停用，需要時再設如 0.95）
+    AI_SEMANTIC_THRESHOLD = _env_float("AI_SEMANTIC_THRESHOLD", 0.0)
+
+    # 首日且非族群漲停的個股改用固定點評，不呼叫 AI（預設關閉）
+    # 取捨：開啟後首日漲停股要等全部掃完才分析（判斷族群），其個股推播也延到掃描結束才送出
+    AI_FAST_PATH = _env_bool("AI_FAST_PATH", default=False)
+
     # dashboard
     DASHBOARD_URL = os.getenv(
         "DASHBOARD_URL",
@@ -130,6 +140,9 @@ def load_config() -> dict:
         "AI_COOLDOWN_MAX": Config.AI_COOLDOWN_MAX,
         "AI_SECTOR_COOLDOWN_MIN": Config.AI_SECTOR_COOLDOWN_MIN,
         "AI_SECTOR_COOLDOWN_MAX": Config.AI_SECTOR_COOLDOWN_MAX,
+        "AI_MAX_CONCURRENCY": Config.AI_MAX_CONCURRENCY,
+        "AI_SEMANTIC_THRESHOLD": Config.AI_SEMANTIC_THRESHOLD,
+        "AI_FAST_PATH": Config.AI_FAST_PATH,
 
         "DASHBOARD_URL": Config.DASHBOARD_URL,
     }
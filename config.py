@@ -64,6 +64,10 @@ class Config:
     AI_COOLDOWN_MAX = _env_float("AI_COOLDOWN_MAX", 9.0)
     AI_SECTOR_COOLDOWN_MIN = _env_float("AI_SECTOR_COOLDOWN_MIN", 12.0)
     AI_SECTOR_COOLDOWN_MAX = _env_float("AI_SECTOR_COOLDOWN_MAX", 15.0)
+    AI_MAX_CONCURRENCY = _env_int("AI_MAX_CONCURRENCY", 1)
+    AI_SEMANTIC_THRESHOLD = _env_float("AI_SEMANTIC_THRESHOLD", 0.0)
+    # 首日非族群漲停改用固定點評；開啟後首日漲停股的推播延到掃描結束（要等全部掃完才知道是否為族群）
+    AI_FAST_PATH = _env_bool("AI_FAST_PATH", default=False)
 
     DASHBOARD_URL = os.getenv(
         "DASHBOARD_URL",
@@ -96,6 +100,9 @@ def load_config() -> dict:
         "AI_COOLDOWN_MAX": Config.AI_COOLDOWN_MAX,
         "AI_SECTOR_COOLDOWN_MIN": Config.AI_SECTOR_COOLDOWN_MIN,
         "AI_SECTOR_COOLDOWN_MAX": Config.AI_SECTOR_COOLDOWN_MAX,
+        "AI_MAX_CONCURRENCY": Config.AI_MAX_CONCURRENCY,
+        "AI_SEMANTIC_THRESHOLD": Config.AI_SEMANTIC_THRESHOLD,
+        "AI_FAST_PATH": Config.AI_FAST_PATH,
 
         "DASHBOARD_URL": Config.DASHBOARD_URL,
     }
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import json
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 from logger import log
 
 try:
@@ -8,6 +10,9 @@ try:
 except Exception:
     create_client = None
 
+# 批次查詢連板天數時每個請求帶的股票數（5 天 x 100 檔仍在 PostgREST 預設 1000 筆上限內）
+CONSECUTIVE_QUERY_CHUNK = 100
+
 
 class DBRepo:
     def __init__(self, url: str | None, key: str | None):
@@ -28,44 +33,71 @@ class DBRepo:
     def is_ready(self) -> bool:
         return self.client is not None
 
-    def save_stock_with_analysis(self, stock_info: dict) -> bool:
-        if not self.is_ready():
+    @staticmethod
+    def _stock_row(stock_info: dict, now: datetime) -> dict:
+        return {
+            "analysis_date": now.strftime("%Y-%m-%d"),
+            "symbol": stock_info["symbol"],
+            "stock_name": stock_info["name"],
+            "sector": stock_info.get("sector", ""),
+            "return_rate": stock_info.get("return", 0),
+            "price": stock_info.get("price", 0),
+            "is_rotc": stock_info.get("is_rotc", False),
+            "ai_comment": stock_info.get("ai_comment", ""),
+            "consecutive_days": stock_info.get("consecutive_days", 1),
+            "volume_ratio": stock_info.get("volume_ratio"),
+            "created_at": now.isoformat(),
+        }
+
+    def _upsert_stock_rows(self, rows: list[dict]):
+        self.client.table("individual_stock_analysis").upsert(
+            rows, on_conflict="analysis_date,symbol"
+        ).execute()
+
+    def save_stocks_with_analysis(self, stocks: list[dict]) -> bool:
+        """
+        多檔股票以單一 upsert 寫入（一次往返），衝突鍵為 (analysis_date, symbol)
+        整批失敗時改逐檔寫入，一檔資料有問題不會連帶整批遺失；回傳是否全部寫入成功
+        """
+        if not self.is_ready() or not stocks:
+            return False
+        now = datetime.now()  # 只取一次時間，日期與 created_at 不會跨日不一致
+        rows = []
+        ok = True
+        for s in stocks:
+            try:
+                rows.append(self._stock_row(s, now))
+            except Exception as e:
+                log(f"儲存股票分析失敗 {s.get('symbol', '')}: {e}")
+                ok = False
+        if not rows:
             return False
         try:
-            today_str = datetime.now().strftime("%Y-%m-%d")
-            data = {
-                "analysis_date": today_str,
-                "symbol": stock_info["symbol"],
-                "stock_name": stock_info["name"],
-                "sector": stock_info.get("sector", ""),
-                "return_rate": stock_info.get("return", 0),
-                "price": stock_info.get("price", 0),
-                "is_rotc": stock_info.get("is_rotc", False),
-                "ai_comment": stock_info.get("ai_comment", ""),
-                "consecutive_days": stock_info.get("consecutive_days", 1),
-                "volume_ratio": stock_info.get("volume_ratio"),
-                "created_at": datetime.now().isoformat(),
-            }
-            self.client.table("individual_stock_analysis").upsert(
-                data, on_conflict="analysis_date,symbol"
-            ).execute()
-            return True
+            self._upsert_stock_rows(rows)
+            return ok
         except Exception as e:
-            log(f"儲存股票分析失敗 {stock_info.get('symbol')}: {e}")
-            return False
+            log(f"批次儲存股票分析失敗（{len(rows)} 檔），改逐檔寫入: {e}")
+        for row in rows:
+            try:
+                self._upsert_stock_rows([row])
+            except Exception as e:
+                log(f"儲存股票分析失敗 {row['symbol']}: {e}")
+                ok = False
+        return ok
 
     def save_sector_analysis(self, sector_name: str, stocks_in_sector: list[dict], ai_analysis: str) -> bool:
         if not self.is_ready():
             return False
         try:
-            today_str = datetime.now().strftime("%Y-%m-%d")
+            now = datetime.now()
+            today_str = now.strftime("%Y-%m-%d")
             data = {
                 "analysis_date": today_str,
                 "sector_name": sector_name,
                 "stock_count": len(stocks_in_sector),
                 "stocks_included": json.dumps([s["symbol"] for s in stocks_in_sector]),
                 "ai_analysis": ai_analysis,
-                "created_at": datetime.now().isoformat(),
+                "created_at": now.isoformat(),
             }
             self.client.table("sector_analysis").upsert(data).execute()
             return True
@@ -73,60 +105,68 @@ class DBRepo:
             log(f"儲存產業分析失敗 {sector_name}: {e}")
             return False
 
-    def get_consecutive_limit_up_days(self, symbol: str, main_threshold: float, rotc_threshold: float) -> int:
+    @staticmethod
+    def _count_consecutive(records: list[dict], main_threshold: float, rotc_threshold: float) -> int:
+        sorted_records = sorted(records, key=lambda x: x["analysis_date"])[-5:]
+        if not sorted_records:
+            return 1
+        # 一次轉成 float 陣列（None / 無法轉換的值變成 NaN，比較結果為 False 即視為中斷）
+        rates = pd.to_numeric(pd.Series([r.get("return_rate") for r in sorted_records], dtype=object),
+                              errors="coerce").to_numpy(dtype=np.float64)
+        thresholds = np.where([bool(r.get("is_rotc", False)) for r in sorted_records], rotc_threshold, main_threshold)
+        hits = rates >= thresholds
+        consecutive = len(hits) if hits.all() else int(np.argmin(hits))
+        return max(consecutive, 1)
+
+    def get_consecutive_limit_up_days_bulk(
+        self, symbols: list[str], main_threshold: float, rotc_threshold: float
+    ) -> dict[str, int]:
         """
-        查詢最近 5 天連續漲停天數（用 DB 既有紀錄）
+        一次查詢多檔股票最近 5 天的紀錄，在記憶體中分組計算連續漲停天數
+        每 CONSECUTIVE_QUERY_CHUNK 檔一個請求，不再每檔各打一次資料庫
         """
-        if not self.is_ready():
-            return 1
+        result = {s: 1 for s in symbols}
+        if not self.is_ready() or not symbols:
+            return result
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            five_days_ago = (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d")
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
+            five_days_ago = (now - timedelta(days=5)).strftime("%Y-%m-%d")
 
-            resp = (
-                self.client.table("individual_stock_analysis")
-                .select("analysis_date, return_rate, is_rotc")
-                .eq("symbol", symbol)
-                .gte("analysis_date", five_days_ago)
-                .lte("analysis_date", today)
-                .order("analysis_date", desc=False)
-                .execute()
-            )
-            if not resp.data:
-                return 1
+            records_by_symbol: dict[str, list[dict]] = {}
+            for i in range(0, len(symbols), CONSECUTIVE_QUERY_CHUNK):
+                resp = (
+                    self.client.table("individual_stock_analysis")
+                    .select("symbol, analysis_date, return_rate, is_rotc")
+                    .in_("symbol", symbols[i:i + CONSECUTIVE_QUERY_CHUNK])
+                    .gte("analysis_date", five_days_ago)
+                    .lte("analysis_date", today)
+                    .order("analysis_date", desc=False)
+                    .execute()
+                )
+                for r in resp.data or []:
+                    records_by_symbol.setdefault(r["symbol"], []).append(r)
 
-            sorted_records = sorted(resp.data, key=lambda x: x["analysis_date"])
-            consecutive = 0
-            for r in sorted_records[-5:]:
-                rr = r.get("return_rate")
-                is_rotc = bool(r.get("is_rotc", False))
-                threshold = rotc_threshold if is_rotc else main_threshold
-                if rr is None:
-                    break
-                try:
-                    if float(rr) >= threshold:
-                        consecutive += 1
-                    else:
-                        break
-                except Exception:
-                    break
-
-            return max(consecutive, 1)
+            for symbol, records in records_by_symbol.items():
+                if symbol in result:
+                    result[symbol] = self._count_consecutive(records, main_threshold, rotc_threshold)
+            return result
         except Exception as e:
-            log(f"查詢連續漲停天數失敗 {symbol}: {e}")
-            return 1
+            log(f"查詢連續漲停天數失敗 {', '.join(symbols[:5])}: {e}")
+            return result
 
     def upsert_daily_market_summary(self, total_stocks: int, limit_up_stocks: list[dict], market_summary: str):
         if not self.is_ready():
             return
         try:
-            today_str = datetime.now().strftime("%Y-%m-%d")
+            now = datetime.now()
+            today_str = now.strftime("%Y-%m-%d")
             safe_data = {
                 "analysis_date": today_str,
                 "stock_count": total_stocks,
                 "summary_content": market_summary[:5000],
                 "stock_list": ", ".join([f"{s['name']}({s['symbol']})" for s in limit_up_stocks]) if limit_up_stocks else "無",
-                "created_at": datetime.now().isoformat(),
+                "created_at": now.isoformat(),
             }
             self.client.table("daily_market_summary").upsert(safe_data).execute()
         except Exception as e:
@@ -5,7 +5,9 @@ import warnings
 import pandas as pd
 import yfinance as yf
 from tqdm import tqdm
+from collections import Counter
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from logger import log
 from utils import clean_markdown
@@ -108,6 +110,104 @@ def _send_layered_notifications(tg, stocks: list[dict], sector_analyses: dict, m
         tg.send(msg, delay=0.2)
 
 
+def _fill_consecutive_days(found: list[dict], db_repo, main_th: float, rotc_th: float):
+    """掃描時連板天數一律先填 1；AI 快速路徑需要真正的天數，這裡先以一次批次查詢補上"""
+    if not db_repo.is_ready():
+        return
+    consecutive = db_repo.get_consecutive_limit_up_days_bulk(
+        [info["symbol"] for info in found], main_threshold=main_th, rotc_threshold=rotc_th
+    )
+    for info in found:
+        info["consecutive_days"] = consecutive[info["symbol"]]
+
+
+def _analyze_fast_path_deferred(deferred: list[dict], limit_up_stocks: list[dict], ai_service):
+    """
+    首日漲停股要等全部掃完才知道同產業有沒有其他漲停股（族群），掃描中先延後，這裡再一次分析：
+    族群股照常打 AI，其餘由分析器套用快速路徑的固定點評；結果由之後的整批儲存寫回 DB，
+    這些股票的個股推播也等到這裡有點評後才送出
+    """
+    sector_counts = Counter(st.get("sector", "其他") for st in limit_up_stocks)
+    for info in deferred:
+        info["is_hot_sector"] = sector_counts[info.get("sector", "其他")] >= 2
+    comments = ai_service.analyze_individual_batch(deferred)
+    for info in deferred:
+        res = comments.get(info["symbol"])
+        if res:
+            info["ai_comment"] = res
+
+
+def _run_sector_analyses(limit_up_stocks: list[dict], db_repo, ai_service, cd_min: float, cd_max: float) -> dict:
+    """產業 AI（可關）：同產業 2 檔以上才分析，結果存入 DB；回傳 {產業: 分析}"""
+    sector_analyses = {}
+    if not ai_service.enable_sector:
+        return sector_analyses
+
+    log("🏭 進行產業AI分析...")
+    sector_groups: dict[str, list[dict]] = {}
+    for st in limit_up_stocks:
+        sector_groups.setdefault(st.get("sector", "其他"), []).append(st)
+
+    for sector, stocks_in_sector in sector_groups.items():
+        if len(stocks_in_sector) <= 1:
+            continue
+        analysis = ai_service.analyze_sector(sector, stocks_in_sector)
+        if analysis:
+            sector_analyses[sector] = analysis
+            if db_repo.is_ready():
+                db_repo.save_sector_analysis(sector, stocks_in_sector, analysis)
+        time.sleep(random.uniform(cd_min, cd_max))
+    return sector_analyses
+
+
+def _notify_stocks(stocks: list[dict], tg, ai_enabled: bool, dash_url: str):
+    """逐檔推播漲停股（含 AI 點評；開啟 AI 但還沒有點評時顯示處理中）"""
+    for info in stocks:
+        symbol = info["symbol"]
+        ai_comment = ""
+        if ai_enabled:
+            ai_comment = info.get("ai_comment") or "AI 分析處理中，請稍後查看儀表板。"
+
+        try:
+            code = symbol.split(".")[0]
+            safe_ai = clean_markdown((ai_comment or "")[:150])
+            emoji = "🚀" if not info["is_rotc"] else "🧧"
+
+            msg = (
+                f"{emoji} *發現漲停強勢股: {info['name']}* ({symbol})\n"
+                f"📈 漲幅: {info['return']:.2%} | 💵 價格: {info['price']:.2f}\n"
+                f"🏭 產業: {info['sector']}\n"
+                + (f"🤖 AI點評: {safe_ai}...\n\n" if safe_ai else "\n")
+                + (f"🔗 [查看網頁儀表板]({dash_url})\n" if dash_url else "")
+                + f"📊 [玩股網K線](https://www.wantgoo.com/stock/{code}/technical-chart)"
+            )
+            tg.send(msg, delay=1.0)
+        except Exception as e:
+            log(f"❌ Telegram 發送流程失敗 {symbol}: {e}")
+
+
+def _analyze_and_notify(found: list[dict], tg, db_repo, ai_service, dash_url: str, deferred: set[str] = frozenset()):
+    """
+    個股 AI（可關）+ 推播：同一批次的漲停股一起送進 AIService 並行分析，
+    結果回來後依發現順序寫回 DB 並推播（即使關 AI 也照發）
+    deferred: 延到掃描結束才分析的代碼（見 _analyze_fast_path_deferred），連同推播一起延後
+    """
+    ai_enabled = ai_service.is_ready() and ai_service.enable_individual
+    to_analyze = [info for info in found if info["symbol"] not in deferred]
+    comments = ai_service.analyze_individual_batch(to_analyze) if ai_enabled else {}
+
+    analyzed = []
+    for info in to_analyze:
+        res = comments.get(info["symbol"])
+        if res:
+            info["ai_comment"] = res
+            analyzed.append(info)
+    if analyzed and db_repo.is_ready():
+        db_repo.save_stocks_with_analysis(analyzed)
+
+    _notify_stocks(to_analyze, tg, ai_enabled, dash_url)
+
+
 def run_monitor(cfg: dict, tg, db_repo, ai_service):
     start = time.time()
     log("🚀 啟動台股漲停板掃描系統（模組化整合版）...")
@@ -144,17 +244,19 @@ def run_monitor(cfg: dict, tg, db_repo, ai_service):
     req_delay_min = float(cfg.get("REQUEST_DELAY_MIN", 1.0))
     req_delay_max = float(cfg.get("REQUEST_DELAY_MAX", 2.5))
 
-    ai_cd_min = float(cfg.get("AI_COOLDOWN_MIN", 6.0))
-    ai_cd_max = float(cfg.get("AI_COOLDOWN_MAX", 9.0))
-
     sector_cd_min = float(cfg.get("AI_SECTOR_COOLDOWN_MIN", 12.0))
     sector_cd_max = float(cfg.get("AI_SECTOR_COOLDOWN_MAX", 15.0))
 
+    # AI 快速路徑：首日漲停股延到掃描結束再分析（見 _analyze_fast_path_deferred）
+    fast_path = ai_service.is_ready() and ai_service.enable_individual and ai_service.fast_path
+    fast_path_deferred: list[dict] = []
+
     for batch_idx, batch_symbols in enumerate(tqdm(batches, desc="批次進度", unit="batch")):
         try:
             if batch_idx > 0:
                 time.sleep(random.uniform(req_delay_min, req_delay_max))
 
+            found_in_batch: list[dict] = []
             df_batch = yf.download(
                 batch_symbols,
                 period="2d",
@@ -205,47 +307,24 @@ def run_monitor(cfg: dict, tg, db_repo, ai_service):
                     }
                     limit_up_stocks.append(info)
                     found_count += 1
-
-                    # 1) 先存基本資料（不含 AI）
-                    if db_repo.is_ready():
-                        db_repo.save_stock_with_analysis(info)
-
-                    # 2) 個股 AI（可關）
-                    ai_comment = ""
-                    if ai_service.is_ready() and ai_service.enable_individual:
-                        ai_comment = "AI 分析處理中，請稍後查看儀表板。"
-                        res = ai_service.analyze_individual(info)
-                        if res:
-                            ai_comment = res
-                            info["ai_comment"] = ai_comment
-                            if db_repo.is_ready():
-                                db_repo.save_stock_with_analysis(info)
-
-                        # ✅ 只有真的打 AI 才冷卻
-                        time.sleep(random.uniform(ai_cd_min, ai_cd_max))
-
-                    # 3) 推播（即使關 AI 也照發）
-                    try:
-                        code = symbol.split(".")[0]
-                        safe_ai = clean_markdown((ai_comment or "")[:150])
-                        emoji = "🚀" if not info["is_rotc"] else "🧧"
-
-                        msg = (
-                            f"{emoji} *發現漲停強勢股: {info['name']}* ({symbol})\n"
-                            f"📈 漲幅: {ret:.2%} | 💵 價格: {info['price']:.2f}\n"
-                            f"🏭 產業: {info['sector']}\n"
-                            + (f"🤖 AI點評: {safe_ai}...\n\n" if safe_ai else "\n")
-                            + (f"🔗 [查看網頁儀表板]({dash_url})\n" if dash_url else "")
-                            + f"📊 [玩股網K線](https://www.wantgoo.com/stock/{code}/technical-chart)"
-                        )
-                        tg.send(msg, delay=1.0)
-                    except Exception as e:
-                        log(f"❌ Telegram 發送流程失敗 {symbol}: {e}")
+                    found_in_batch.append(info)
 
                 except Exception:
                     error_count += 1
                     continue
 
+            # 本批次的漲停股：先以單一 upsert 存基本資料（不含 AI），個股 AI 並行呼叫，再依序寫回與推播
+            if found_in_batch:
+                if db_repo.is_ready():
+                    db_repo.save_stocks_with_analysis(found_in_batch)
+                deferred = set()
+                if fast_path:
+                    _fill_consecutive_days(found_in_batch, db_repo, main_th, rotc_th)
+                    first_day = [info for info in found_in_batch if info["consecutive_days"] <= 1]
+                    fast_path_deferred.extend(first_day)
+                    deferred = {info["symbol"] for info in first_day}
+                _analyze_and_notify(found_in_batch, tg, db_repo, ai_service, dash_url, deferred)
+
         except Exception as e:
             log(f"批次 {batch_idx} 下載失敗: {str(e)[:100]}")
             error_count += len(batch_symbols)
@@ -253,10 +332,14 @@ def run_monitor(cfg: dict, tg, db_repo, ai_service):
 
     log(f"掃描完成，發現 {found_count} 檔漲停股票")
 
+    if fast_path_deferred:
+        log(f"🤖 首日漲停個股 AI（{len(fast_path_deferred)} 檔，依最終產業分布判斷族群）...")
+        _analyze_fast_path_deferred(fast_path_deferred, limit_up_stocks, ai_service)
+        _notify_stocks(fast_path_deferred, tg, True, dash_url)
+
     # ✅ 先確保全部基本資料都在 DB
     if limit_up_stocks and db_repo.is_ready():
-        for st in limit_up_stocks:
-            db_repo.save_stock_with_analysis(st)
+        db_repo.save_stocks_with_analysis(limit_up_stocks)
 
     # ========== AI 分析階段（產業/市場） ==========
     sector_analyses = {}
@@ -266,32 +349,23 @@ def run_monitor(cfg: dict, tg, db_repo, ai_service):
         # 連板天數（不打 AI）
         if db_repo.is_ready():
             log("📅 計算連續漲停天數...")
+            consecutive = db_repo.get_consecutive_limit_up_days_bulk(
+                [st["symbol"] for st in limit_up_stocks], main_threshold=main_th, rotc_threshold=rotc_th
+            )
             for st in limit_up_stocks:
-                st["consecutive_days"] = db_repo.get_consecutive_limit_up_days(
-                    st["symbol"], main_threshold=main_th, rotc_threshold=rotc_th
-                )
-                db_repo.save_stock_with_analysis(st)
-
-        # 產業 AI（可關）
-        if ai_service.enable_sector:
-            log("🏭 進行產業AI分析...")
-            sector_groups: dict[str, list[dict]] = {}
-            for st in limit_up_stocks:
-                sector_groups.setdefault(st.get("sector", "其他"), []).append(st)
-
-            for sector, stocks_in_sector in sector_groups.items():
-                if len(stocks_in_sector) <= 1:
-                    continue
-                analysis = ai_service.analyze_sector(sector, stocks_in_sector)
-                if analysis:
-                    sector_analyses[sector] = analysis
-                    if db_repo.is_ready():
-                        db_repo.save_sector_analysis(sector, stocks_in_sector, analysis)
-                time.sleep(random.uniform(sector_cd_min, sector_cd_max))
-
-        # 市場 AI（可關）
-        if ai_service.enable_market:
-            market_summary = ai_service.analyze_market(limit_up_stocks)
+                st["consecutive_days"] = consecutive[st["symbol"]]
+            db_repo.save_stocks_with_analysis(limit_up_stocks)
+
+        # 市場 AI（可關）與產業 AI 互不依賴；允許並行時丟到背景執行緒，和產業迴圈同時跑
+        if ai_service.enable_market and ai_service.max_concurrency > 1:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                market_future = pool.submit(ai_service.analyze_market, limit_up_stocks)
+                sector_analyses = _run_sector_analyses(limit_up_stocks, db_repo, ai_service, sector_cd_min, sector_cd_max)
+                market_summary = market_future.result()
+        else:
+            sector_analyses = _run_sector_analyses(limit_up_stocks, db_repo, ai_service, sector_cd_min, sector_cd_max)
+            if ai_service.enable_market:
+                market_summary = ai_service.analyze_market(limit_up_stocks)
 
         _send_layered_notifications(tg, limit_up_stocks, sector_analyses, market_summary)
 
@@ -4,21 +4,9 @@
 """
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
 import sys
 import os
-import urllib.parse
-import pytz  # 新增：用於時區處理
-
-# 定義台灣時區
-TAIWAN_TZ = pytz.timezone('Asia/Taipei')
-
-# 獲取台灣時間的現在時刻
-def get_taiwan_now():
-    """返回台灣時間的當前時刻"""
-    utc_now = datetime.now(pytz.utc)
-    taiwan_now = utc_now.astimezone(TAIWAN_TZ)
-    return taiwan_now
+
 # 設定頁面配置
 st.set_page_config(
     page_title="Alpha-Refinery 漲停戰情室 2.0",
@@ -26,35 +14,6 @@ st.set_page_config(
     page_icon="🚀"
 )
 
-# 自訂CSS樣式
-st.markdown("""
-    <style>
-    .stMetric { background-color: #ffffff; padding: 15px; border-radius: 10px; border: 1px solid #f0f2f6; box-shadow: 2px 2px 5px rgba(0,0,0,0.05); }
-    .ai-section { background-color: #fff3cd; padding: 15px; border-radius: 8px; border-left: 5px solid #ffc107; }
-    .stock-card { border: 1px solid #e0e0e0; border-radius: 8px; padding: 12px; margin: 8px 0; background: linear-gradient(135deg, #f5f7fa 0%, #e4edf5 100%); }
-    .password-protected { border: 2px solid #ff6b6b; border-radius: 8px; padding: 15px; background-color: #fff5f5; }
-    .welcome-header { 
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 3rem 2rem;
-        border-radius: 15px;
-        color: white;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .feature-card {
-        background: white;
-        border-radius: 10px;
-        padding: 1.5rem;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        transition: transform 0.3s;
-        height: 100%;
-    }
-    .feature-card:hover {
-        transform: translateY(-5px);
-    }
-    </style>
-""", unsafe_allow_html=True)
-
 # ========== 導入共享功能 ==========
 import sys
 import os
@@ -69,12 +28,17 @@ sys.path.insert(0, parent_dir)
 try:
     # 從 utils 包導入
     from utils import (
+        inject_css,
         init_connections, 
-        fetch_today_data, 
-        get_stock_links,
-        get_wantgoo_url,
-        get_goodinfo_url,
-        get_cnyes_url,
+        render_status_table,
+        render_cache_tools,
+        get_taiwan_now,
+        fetch_today_tables,
+        build_links,
+        get_data_version,
+        build_display_df,
+        build_sector_index,
+        encode_prompt,
         call_ai_safely
     )
 except ImportError as e:
@@ -85,6 +49,9 @@ except ImportError as e:
     st.error(f"目錄內容: {os.listdir(parent_dir)}")
     st.stop()
 
+# 自訂CSS樣式（見 assets/）
+inject_css("base", "stock", "report")
+
 # 初始化連線
 supabase, gemini_model = init_connections()
 
@@ -92,6 +59,15 @@ supabase, gemini_model = init_connections()
 # 新：
 taiwan_now = get_taiwan_now()
 today = taiwan_now.strftime("%Y-%m-%d")
+
+# 並行載入今日漲停與大盤總結，只等待一次資料庫往返
+if supabase:
+    df_limit_ups, summary_df = fetch_today_tables(
+        ("individual_stock_analysis", "daily_market_summary"), today
+    )
+else:
+    df_limit_ups, summary_df = pd.DataFrame(), pd.DataFrame()
+
 # ========== 密碼保護機制 ==========
 if 'gemini_authorized' not in st.session_state:
     st.session_state.gemini_authorized = False
@@ -119,13 +95,7 @@ with col2:
 
 with col3:
     if supabase:
-        try:
-            # 修改這裡：移除 supabase 參數
-            df_limit = fetch_today_data("individual_stock_analysis", today)
-            limit_count = len(df_limit) if not df_limit.empty else 0
-            st.metric("今日漲停", f"{limit_count}檔")
-        except Exception as e:
-            st.metric("今日漲停", "載入中...")
+        st.metric("今日漲停", f"{len(df_limit_ups)}檔")
     else:
         st.metric("今日漲停", "N/A")
 
@@ -136,8 +106,6 @@ st.divider()
 st.header("📊 今日大盤總結")
 
 if supabase:
-    # 修改這裡：移除 supabase 參數
-    summary_df = fetch_today_data("daily_market_summary", today)
     if not summary_df.empty:
         summary_content = summary_df.iloc[0]['summary_content']
         st.info(summary_content)
@@ -152,22 +120,13 @@ st.divider()
 st.header("🔥 今日漲停板概覽")
 
 if supabase:
-    # 修改這裡：移除 supabase 參數
-    df_limit_ups = fetch_today_data("individual_stock_analysis", today)
-    
     if not df_limit_ups.empty:
         # ========== 主表格功能（你要的功能） ==========
         st.subheader("📊 漲停股票列表")
         
-        # 添加連結欄位
-        df_limit_ups['玩股網K線'] = df_limit_ups['symbol'].apply(get_wantgoo_url)
-        df_limit_ups['Goodinfo'] = df_limit_ups['symbol'].apply(get_goodinfo_url)
-        df_limit_ups['鉅亨網'] = df_limit_ups['symbol'].apply(get_cnyes_url)
-
-        display_df = df_limit_ups[['stock_name', 'symbol', 'sector', 'ai_comment',
-                                   '玩股網K線', 'Goodinfo', '鉅亨網']].copy()
-        display_df.columns = ['股票名稱', '代碼', '產業別', 'AI點評',
-                             '📈 K線圖', '📊 財報', '📰 新聞']
+        # 連結欄位與欄名轉換已快取，widget 互動造成的 rerun 不會重算
+        data_version = get_data_version(df_limit_ups, today)
+        display_df = build_display_df(df_limit_ups, data_version)
 
         st.dataframe(
             display_df,
@@ -187,7 +146,7 @@ if supabase:
             st.metric("總漲停家數", f"{len(df_limit_ups)}家")
         with col_s2:
             if 'is_rotc' in df_limit_ups.columns:
-                rotc_count = len(df_limit_ups[df_limit_ups['is_rotc'] == True])
+                rotc_count = int(df_limit_ups['is_rotc'].fillna(False).astype(bool).sum())
                 st.metric("興櫃漲停", f"{rotc_count}家")
             else:
                 st.metric("興櫃漲停", "N/A")
@@ -202,27 +161,23 @@ if supabase:
         st.divider()
         st.subheader("🎯 個股深度分析")
         
-        # 建立股票選擇下拉選單
-        stock_options = []
+        # 建立股票選擇下拉選單（顯示文字 -> 股票資料，選取後直接查表）
+        stock_options = {}
         for _, row in df_limit_ups.iterrows():
             display_text = f"{row['symbol']} {row['stock_name']}"
             if 'consecutive_days' in row and row['consecutive_days'] > 0:
                 display_text += f" ({row['consecutive_days']}連板)"
-            stock_options.append((display_text, row))
+            stock_options[display_text] = row
         
         # 下拉選單
         selected_display = st.selectbox(
             "請選擇要分析的漲停股：",
-            options=[so[0] for so in stock_options],
+            options=list(stock_options),
             key="stock_selector"
         )
         
         # 找到選擇的股票
-        selected_stock = None
-        for display, stock in stock_options:
-            if display == selected_display:
-                selected_stock = stock
-                break
+        selected_stock = stock_options.get(selected_display)
         
         if selected_stock is not None:
             # 顯示股票詳細資訊
@@ -251,23 +206,32 @@ if supabase:
             # ========== 同產業聯動參考 ==========
             current_sector = selected_stock.get('sector', '')
             if current_sector:
-                # 找出同產業的其他股票
-                same_sector_stocks = df_limit_ups[df_limit_ups['sector'] == current_sector].copy()
-                same_sector_stocks = same_sector_stocks[same_sector_stocks['symbol'] != selected_stock['symbol']]
+                # 找出同產業的其他股票：由快取的產業索引取出該產業，再排除自己並只取需要的欄位
+                peer_cols = [c for c in ('symbol', 'consecutive_days') if c in df_limit_ups.columns]
+                sector_group = build_sector_index(df_limit_ups, data_version).get(current_sector)
+                if sector_group is not None:
+                    same_sector_stocks = sector_group.loc[sector_group['symbol'] != selected_stock['symbol'], peer_cols]
+                else:
+                    same_sector_stocks = pd.DataFrame(columns=peer_cols)
                 
                 if not same_sector_stocks.empty:
                     st.write(f"🌿 **同產業聯動參考 ({current_sector})：**")
                     
-                    # 建立連結列表
-                    related_links = []
-                    for _, r in same_sector_stocks.iterrows():
-                        link_url = get_wantgoo_url(r['symbol'])
-                        status_icon = "🔥" if r.get('consecutive_days', 0) > 0 else "➡️"
-                        seq_info = f" ({r.get('consecutive_days', 0)}板)" if r.get('consecutive_days', 0) > 0 else ""
-                        related_links.append(f"[{r['symbol']}{seq_info} {status_icon}]({link_url})")
+                    # 建立連結列表（向量化組字串，連結由 build_links 一次產生）
+                    if 'consecutive_days' in same_sector_stocks.columns:
+                        days = same_sector_stocks['consecutive_days'].fillna(0).astype(int)
+                    else:
+                        days = pd.Series(0, index=same_sector_stocks.index)
+                    hot = days > 0
+                    seq_info = (" (" + days.astype(str) + "板)").where(hot, "")
+                    status_icon = hot.map({True: "🔥", False: "➡️"})
+                    link_url = build_links(same_sector_stocks['symbol'])['玩股網K線']
+                    related_links = (
+                        "[" + same_sector_stocks['symbol'].astype(str) + seq_info + " " + status_icon + "](" + link_url + ")"
+                    )
                     
                     # 顯示產業聯動分析
-                    st.markdown(" ".join(related_links))
+                    st.markdown(related_links.str.cat(sep=" "))
             
             # ========== 🤖 AI 專家診斷 ==========
             st.divider()
@@ -319,7 +283,7 @@ if supabase:
             
             with col_ai1:
                 # ChatGPT一鍵帶入
-                encoded_prompt = urllib.parse.quote(expert_prompt)
+                encoded_prompt = encode_prompt(expert_prompt)
                 st.link_button(
                     "🔥 ChatGPT 分析",
                     f"https://chatgpt.com/?q={encoded_prompt}",
@@ -345,52 +309,35 @@ if supabase:
             
             with col_ai4:
                 # Gemini內建診斷（密碼保護）
+                # 解鎖後直接在同一個 slot 換成分析按鈕，不再整頁 st.rerun()
+                gemini_slot = st.empty()
+                if not st.session_state.gemini_authorized:
+                    with gemini_slot.container():
+                        st.markdown('<div class="password-protected">', unsafe_allow_html=True)
+                        st.info("🔒 Gemini 需要授權解鎖")
+                        auth_pw = st.text_input("授權密碼：", type="password", key="stock_gemini_pw")
+                        if st.button("解鎖 Gemini", key="stock_gemini_auth"):
+                            if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
+                                st.session_state.gemini_authorized = True
+                            else:
+                                st.error("密碼錯誤")
+                        st.markdown('</div>', unsafe_allow_html=True)
                 if st.session_state.gemini_authorized:
-                    if st.button("🤖 Gemini 分析", use_container_width=True, type="primary"):
-                        with st.spinner("Gemini正在分析中..."):
-                            ai_response = call_ai_safely(expert_prompt, gemini_model)
-                            if ai_response:
-                                st.session_state.gemini_stock_report = ai_response
-                                st.rerun()
-                else:
-                    st.markdown('<div class="password-protected">', unsafe_allow_html=True)
-                    st.info("🔒 Gemini 需要授權解鎖")
-                    auth_pw = st.text_input("授權密碼：", type="password", key="stock_gemini_pw")
-                    if st.button("解鎖 Gemini", key="stock_gemini_auth"):
-                        if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
-                            st.session_state.gemini_authorized = True
-                            st.rerun()
-                        else:
-                            st.error("密碼錯誤")
-                    st.markdown('</div>', unsafe_allow_html=True)
+                    with gemini_slot.container():
+                        if st.button("🤖 Gemini 分析", use_container_width=True, type="primary"):
+                            with st.spinner("Gemini正在分析中..."):
+                                ai_response = call_ai_safely(expert_prompt, gemini_model)
+                                if ai_response:
+                                    st.session_state.gemini_stock_report = ai_response
+                                    st.rerun()
             
             # === Gemini 個股報告獨立顯示 ===
             if 'gemini_stock_report' in st.session_state:
                 st.divider()
                 with st.expander(f"🤖 Gemini 個股分析報告：{selected_stock['stock_name']}", expanded=True):
                     ai_response = st.session_state.gemini_stock_report
-                    st.markdown(
-                        f"""
-                        <div style="
-                            background-color: #f8f9fa !important;
-                            padding: 30px !important;
-                            border-radius: 15px !important;
-                            border-left: 8px solid #28a745 !important;
-                            box-shadow: 0 6px 20px rgba(0,0,0,0.12) !important;
-                            line-height: 2 !important;
-                            font-size: 17px !important;
-                            white-space: pre-wrap !important;
-                            word-wrap: break-word !important;
-                            max-width: 100% !important;
-                            width: 100% !important;
-                            box-sizing: border-box !important;
-                            margin: 10px 0 !important;
-                        ">
-                        {ai_response.replace('\n', '<br>')}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    with st.container(key="ai_report"):
+                        st.markdown(ai_response)
 
                     # 舊：report_text = f"# {selected_stock['stock_name']} AI分析報告\n\n日期：{today}\n\n{ai_response}"
                     # 新：
@@ -417,18 +364,7 @@ else:
 with st.sidebar:
     st.header("⚙️ 設定")
     st.subheader("🔧 系統狀態")
-    status_col1, status_col2, status_col3 = st.columns(3)
-    with status_col1:
-        st.metric("Supabase", "✅" if supabase else "❌")
-    with status_col2:
-        st.metric("Gemini", "✅" if gemini_model else "❌")
-    with status_col3:
-        if supabase:
-            df_limit = fetch_today_data("individual_stock_analysis", today)
-            limit_count = len(df_limit) if not df_limit.empty else 0
-            st.metric("漲停股票", f"{limit_count}" if not df_limit.empty else "0")
-        else:
-            st.metric("漲停股票", "0")
+    render_status_table(supabase, gemini_model, len(df_limit_ups))
     
     st.divider()
     
@@ -459,12 +395,7 @@ with st.sidebar:
     
     st.divider()
     
-    st.subheader("🛠️ 除錯與維護工具")
-    if st.button("🔄 強制清除所有快取並重新載入"):
-        st.cache_data.clear()
-        st.cache_resource.clear()
-        st.success("所有快取已清除！正在重新載入最新資料...")
-        st.rerun()
+    render_cache_tools()
 
 # --- 底部導覽列 ---
 st.divider()
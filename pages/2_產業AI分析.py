@@ -3,11 +3,8 @@
 🏭 產業AI分析頁面 - 選擇產業族群進行分析
 """
 import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
 import sys
 import os
-import urllib.parse
 
 # 設定頁面配置
 st.set_page_config(
@@ -16,27 +13,6 @@ st.set_page_config(
     page_icon="🏭"
 )
 
-# 添加自訂CSS
-st.markdown("""
-    <style>
-    .sector-card {
-        background: white;
-        border-radius: 10px;
-        padding: 20px;
-        margin: 10px 0;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .sector-header {
-        background: linear-gradient(135deg, #2196F3 0%, #21CBF3 100%);
-        color: white;
-        padding: 20px;
-        border-radius: 10px;
-        margin-bottom: 20px;
-    }
-    .ai-section { background-color: #fff3cd; padding: 15px; border-radius: 8px; border-left: 5px solid #ffc107; }
-    </style>
-""", unsafe_allow_html=True)
-
 # ========== 導入共享功能 ==========
 # 添加父目錄到路徑，讓 Python 能找到 utils 包
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -48,8 +24,18 @@ sys.path.insert(0, parent_dir)
 try:
     # 從 utils 包導入
     from utils import (
+        inject_css,
         init_connections, 
+        render_status_table,
+        render_cache_tools,
+        get_taiwan_now,
         fetch_today_data, 
+        get_data_version,
+        FRAME_HASH_FUNCS,
+        build_sector_index,
+        build_sector_counts,
+        encode_prompt,
+        df_to_markdown_table,
         call_ai_safely
     )
 except ImportError as e:
@@ -59,9 +45,14 @@ except ImportError as e:
     st.error(f"目錄內容: {os.listdir(parent_dir)}")
     st.stop()
 
+# 自訂CSS樣式（見 assets/）
+inject_css("sector", "report")
+
 # 初始化連線
 supabase, gemini_model = init_connections()
-today = datetime.now().strftime("%Y-%m-%d")
+# 每次 rerun 只取一次時間，日期與頁尾時間共用
+taiwan_now = get_taiwan_now()
+today = taiwan_now.strftime("%Y-%m-%d")
 
 # ========== 密碼保護機制 ==========
 if 'gemini_authorized' not in st.session_state:
@@ -93,13 +84,14 @@ if 'sector' not in df_limit_ups.columns:
     st.stop()
 
 df_limit_ups['sector'] = df_limit_ups['sector'].fillna('未分類')
-sector_counts = df_limit_ups['sector'].value_counts().reset_index()
+data_version = get_data_version(df_limit_ups, today)
+sector_counts = build_sector_counts(df_limit_ups, data_version).reset_index()
 sector_counts.columns = ['產業別', '漲停家數']
 
-# 計算產業統計
+# 計算產業統計（一次 groupby 建立產業索引，不再逐產業掃描整張表）
+sector_groups = build_sector_index(df_limit_ups, data_version)
 sector_stats = {}
-for sector in df_limit_ups['sector'].unique():
-    sector_stocks = df_limit_ups[df_limit_ups['sector'] == sector]
+for sector, sector_stocks in sector_groups.items():
     avg_seq = sector_stocks['consecutive_days'].mean() if 'consecutive_days' in sector_stocks.columns else 1
     sector_stats[sector] = {
         'count': len(sector_stocks),
@@ -107,53 +99,21 @@ for sector in df_limit_ups['sector'].unique():
         'stocks': sector_stocks[['symbol', 'stock_name', 'consecutive_days']].to_dict('records')
     }
 
-# ========== 產業分析主體 ==========
-st.divider()
-st.subheader("📊 漲停產業別分析")
-
-col1, col2 = st.columns([1.5, 1])
-
-with col1:
-    # ========== 產業分佈圖 ==========
-    st.markdown("<div class='ai-section'>", unsafe_allow_html=True)
-    st.subheader("🤖 產業AI分析")
+@st.cache_data(max_entries=64, hash_funcs=FRAME_HASH_FUNCS)
+def build_sector_prompt(sector_stocks_list, version, selected_sector, sector_data, total_count):
+    """組合產業分析提示詞；同一資料版本下切換回已看過的產業時直接沿用快取"""
+    # 建立產業股票表格 - 不使用 to_markdown()
+    sector_table_df = sector_stocks_list[['symbol', 'stock_name', 'consecutive_days']].copy()
+    sector_table_df.columns = ['代碼', '股票名稱', '連板天數']
     
-    selected_sector = st.selectbox(
-        "選擇產業進行AI分析：",
-        options=sector_counts['產業別'].tolist(),
-        key="sector_selector"
-    )
+    sector_table = df_to_markdown_table(sector_table_df)
     
-    if selected_sector:
-        # 自動生成該產業的AI提示詞
-        sector_data = sector_stats[selected_sector]
-        sector_stocks_list = df_limit_ups[df_limit_ups['sector'] == selected_sector]
-        
-        # 建立產業股票表格 - 不使用 to_markdown()
-        sector_table_df = sector_stocks_list[['symbol', 'stock_name', 'consecutive_days']].copy()
-        sector_table_df.columns = ['代碼', '股票名稱', '連板天數']
-        
-        # 將 DataFrame 轉換為 markdown 格式的字符串
-        def df_to_markdown_table(df):
-            """將 DataFrame 轉換為 markdown 表格字符串"""
-            # 創建表頭
-            headers = "| " + " | ".join(df.columns) + " |\n"
-            # 創建分隔線
-            separators = "| " + " | ".join(["---"] * len(df.columns)) + " |\n"
-            # 創建數據行
-            rows = ""
-            for _, row in df.iterrows():
-                rows += "| " + " | ".join(str(val) for val in row.values) + " |\n"
-            return headers + separators + rows
-        
-        sector_table = df_to_markdown_table(sector_table_df)
-        
-        # 建立產業AI提示詞
-        sector_prompt = f"""請擔任專業市場分析師，分析台灣股市的{selected_sector}產業：
+    # 建立產業AI提示詞
+    return f"""請擔任專業市場分析師，分析台灣股市的{selected_sector}產業：
 
 ## 產業概況
 - **產業名稱**: {selected_sector}
-- **今日漲停家數**: {sector_data['count']}家 (佔總漲停數 {round(sector_data['count']/len(df_limit_ups)*100, 1)}%)
+- **今日漲停家數**: {sector_data['count']}家 (佔總漲停數 {round(sector_data['count']/total_count*100, 1)}%)
 - **平均連板天數**: {sector_data['avg_seq']}天
 
 ## 漲停個股詳情
@@ -161,7 +121,7 @@ with col1:
 
 ## 市場背景
 - 分析日期: {today}
-- 總漲停家數: {len(df_limit_ups)}家
+- 總漲停家數: {total_count}家
 - 市場代號: TW
 
 ## 分析問題
@@ -186,13 +146,39 @@ with col1:
    - 在當前市場環境下，此產業的持續性如何判斷？
 
 請提供具體、可操作的投資建議。"""
+
+# ========== 產業分析主體 ==========
+st.divider()
+st.subheader("📊 漲停產業別分析")
+
+col1, col2 = st.columns([1.5, 1])
+
+with col1:
+    # ========== 產業分佈圖 ==========
+    st.markdown("<div class='ai-section'>", unsafe_allow_html=True)
+    st.subheader("🤖 產業AI分析")
+    
+    selected_sector = st.selectbox(
+        "選擇產業進行AI分析：",
+        options=sector_counts['產業別'].tolist(),
+        key="sector_selector"
+    )
+    
+    if selected_sector:
+        # 自動生成該產業的AI提示詞
+        sector_data = sector_stats[selected_sector]
+        sector_stocks_list = sector_groups[selected_sector]
+        
+        sector_prompt = build_sector_prompt(
+            sector_stocks_list, data_version, selected_sector, sector_data, len(df_limit_ups)
+        )
         
         # 顯示提示詞和AI平台連結
         st.write(f"### 📋 {selected_sector} 產業分析提示詞")
         st.code(sector_prompt, language="text")
         
         # 一鍵帶入AI分析平台
-        encoded_sector_prompt = urllib.parse.quote(sector_prompt)
+        encoded_sector_prompt = encode_prompt(sector_prompt)
         st.link_button(
             f"🔥 一鍵帶入 ChatGPT 分析 {selected_sector}",
             f"https://chatgpt.com/?q={encoded_sector_prompt}",
@@ -220,24 +206,26 @@ with col1:
             )
         
         with col_ai3:
-            # Gemini內建診斷（密碼保護）
+            # Gemini內建診斷（密碼保護），解鎖成功就地換成分析按鈕
+            gemini_slot = st.empty()
+            if not st.session_state.gemini_authorized:
+                with gemini_slot.container():
+                    st.markdown('<div class="password-protected">', unsafe_allow_html=True)
+                    auth_pw = st.text_input("授權密碼：", type="password", key="sector_gemini_pw")
+                    if st.button("解鎖 Gemini", key="sector_gemini_auth"):
+                        if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
+                            st.session_state.gemini_authorized = True
+                        else:
+                            st.error("密碼錯誤")
+                    st.markdown('</div>', unsafe_allow_html=True)
             if st.session_state.gemini_authorized:
-                if st.button("🤖 Gemini 分析", use_container_width=True):
-                    with st.spinner("Gemini正在分析中..."):
-                        ai_response = call_ai_safely(sector_prompt, gemini_model)
-                        if ai_response:
-                            st.session_state.gemini_sector_report = ai_response
-                            st.rerun()
-            else:
-                st.markdown('<div class="password-protected">', unsafe_allow_html=True)
-                auth_pw = st.text_input("授權密碼：", type="password", key="sector_gemini_pw")
-                if st.button("解鎖 Gemini", key="sector_gemini_auth"):
-                    if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
-                        st.session_state.gemini_authorized = True
-                        st.rerun()
-                    else:
-                        st.error("密碼錯誤")
-                st.markdown('</div>', unsafe_allow_html=True)
+                with gemini_slot.container():
+                    if st.button("🤖 Gemini 分析", use_container_width=True):
+                        with st.spinner("Gemini正在分析中..."):
+                            ai_response = call_ai_safely(sector_prompt, gemini_model, kind="sector")
+                            if ai_response:
+                                st.session_state.gemini_sector_report = ai_response
+                                st.rerun()
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -246,28 +234,8 @@ with col1:
         st.divider()
         with st.expander(f"🤖 Gemini 產業分析報告：{selected_sector}", expanded=True):
             ai_response = st.session_state.gemini_sector_report
-            st.markdown(
-                f"""
-                <div style="
-                    background-color: #f8f9fa !important;
-                    padding: 30px !important;
-                    border-radius: 15px !important;
-                    border-left: 8px solid #28a745 !important;
-                    box-shadow: 0 6px 20px rgba(0,0,0,0.12) !important;
-                    line-height: 2 !important;
-                    font-size: 17px !important;
-                    white-space: pre-wrap !important;
-                    word-wrap: break-word !important;
-                    max-width: 100% !important;
-                    width: 100% !important;
-                    box-sizing: border-box !important;
-                    margin: 10px 0 !important;
-                ">
-                {ai_response.replace('\n', '<br>')}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+            with st.container(key="ai_report"):
+                st.markdown(ai_response)
             report_text = f"# {selected_sector} 產業AI分析報告\n\n日期：{today}\n\n{ai_response}"
             st.download_button(
                 label="📥 下載分析報告 (.md)",
@@ -318,13 +286,7 @@ with col2:
 with st.sidebar:
     st.header("⚙️ 設定")
     st.subheader("🔧 系統狀態")
-    status_col1, status_col2, status_col3 = st.columns(3)
-    with status_col1:
-        st.metric("Supabase", "✅" if supabase else "❌")
-    with status_col2:
-        st.metric("Gemini", "✅" if gemini_model else "❌")
-    with status_col3:
-        st.metric("漲停股票", f"{len(df_limit_ups)}" if not df_limit_ups.empty else "0")
+    render_status_table(supabase, gemini_model, len(df_limit_ups))
     
     st.divider()
     
@@ -355,13 +317,8 @@ with st.sidebar:
     
     st.divider()
     
-    st.subheader("🛠️ 除錯與維護工具")
-    if st.button("🔄 強制清除所有快取並重新載入"):
-        st.cache_data.clear()
-        st.cache_resource.clear()
-        st.success("所有快取已清除！正在重新載入最新資料...")
-        st.rerun()
+    render_cache_tools()
 
 # ========== 頁面底部 ==========
 st.divider()
-st.caption(f"產業AI分析頁面 | 更新時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+st.caption(f"產業AI分析頁面 | 更新時間：{taiwan_now.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -4,11 +4,8 @@
 """
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
 import sys
 import os
-import urllib.parse
-import plotly.express as px
 
 # 設定頁面配置
 st.set_page_config(
@@ -17,50 +14,6 @@ st.set_page_config(
     page_icon="🌐"
 )
 
-# 添加自訂CSS
-st.markdown("""
-    <style>
-    .market-header {
-        background: linear-gradient(135deg, #9C27B0 0%, #673AB7 100%);
-        color: white;
-        padding: 25px;
-        border-radius: 15px;
-        margin-bottom: 25px;
-    }
-    .stat-card {
-        background: white;
-        border-radius: 10px;
-        padding: 15px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        text-align: center;
-    }
-    .ai-response-box {
-        background-color: #f8f9fa;
-        padding: 25px;
-        border-radius: 10px;
-        border-left: 5px solid #28a745;
-        margin: 20px 0;
-    }
-    .password-protected {
-        background-color: #fff3cd;
-        padding: 20px;
-        border-radius: 8px;
-        border: 1px solid #ffc107;
-        margin: 15px 0;
-    }
-    .ai-prompt-box {
-        background-color: #e8f4fd;
-        padding: 20px;
-        border-radius: 8px;
-        border-left: 5px solid #2196F3;
-        margin: 15px 0;
-        font-family: monospace;
-        white-space: pre-wrap;
-        overflow-x: auto;
-    }
-    </style>
-""", unsafe_allow_html=True)
-
 # ========== 導入共享功能 ==========
 # 添加父目錄到路徑，讓 Python 能找到 utils 包
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -72,8 +25,15 @@ sys.path.insert(0, parent_dir)
 try:
     # 從 utils 包導入
     from utils import (
+        inject_css,
         init_connections, 
-        fetch_today_data, 
+        get_taiwan_now,
+        fetch_today_tables, 
+        get_data_version,
+        build_sector_counts,
+        FRAME_HASH_FUNCS,
+        encode_prompt,
+        df_to_markdown_table,
         call_ai_safely,
         get_ai_prompt_template
     )
@@ -84,9 +44,14 @@ except ImportError as e:
     st.error(f"目錄內容: {os.listdir(parent_dir)}")
     st.stop()
 
+# 自訂CSS樣式（見 assets/）
+inject_css("market", "report")
+
 # 初始化連線
 supabase, gemini_model = init_connections()
-today = datetime.now().strftime("%Y-%m-%d")
+# 每次 rerun 只取一次時間，日期與頁尾時間共用
+taiwan_now = get_taiwan_now()
+today = taiwan_now.strftime("%Y-%m-%d")
 
 # ========== 密碼保護機制 ==========
 if 'gemini_authorized' not in st.session_state:
@@ -106,8 +71,9 @@ if not supabase:
     st.stop()
 
 # ========== 載入今日數據 ==========
-df_limit_ups = fetch_today_data("individual_stock_analysis", today)
-df_market_summary = fetch_today_data("daily_market_summary", today)
+df_limit_ups, df_market_summary = fetch_today_tables(
+    ("individual_stock_analysis", "daily_market_summary"), today
+)
 
 if df_limit_ups.empty:
     st.info("📊 今日尚未有漲停股票數據，請稍後再試。")
@@ -118,15 +84,16 @@ st.subheader("📊 今日市場統計")
 
 # 計算統計數據
 total_stocks = len(df_limit_ups)
-rotc_count = len(df_limit_ups[df_limit_ups['is_rotc'] == True]) if 'is_rotc' in df_limit_ups.columns else 0
+rotc_count = int(df_limit_ups['is_rotc'].fillna(False).astype(bool).sum()) if 'is_rotc' in df_limit_ups.columns else 0
 main_count = total_stocks - rotc_count
 avg_consecutive = df_limit_ups['consecutive_days'].mean() if 'consecutive_days' in df_limit_ups.columns else 1
 avg_return = df_limit_ups['return_rate'].mean() if 'return_rate' in df_limit_ups.columns else 0
 
-# 產業分佈
+# 產業分佈（算一次並快取，圖表與提示詞共用）
+data_version = get_data_version(df_limit_ups, today)
 if 'sector' in df_limit_ups.columns:
     df_limit_ups['sector'] = df_limit_ups['sector'].fillna('未分類')
-    sector_counts = df_limit_ups['sector'].value_counts().reset_index()
+    sector_counts = build_sector_counts(df_limit_ups, data_version).reset_index()
     sector_counts.columns = ['產業', '漲停家數']
 else:
     sector_counts = pd.DataFrame(columns=['產業', '漲停家數'])
@@ -154,37 +121,58 @@ with col4:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # ========== 產業分佈視覺化 ==========
+SECTOR_CHART_TOP_N = 15
+
+# 圖表物件依產業計數快取：px.bar / px.pie 組 Figure 很慢，計數沒變就直接沿用
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def build_sector_bar_fig(counts):
+    """counts 為 (產業, 漲停家數) tuple，作為快取鍵"""
+    import plotly.express as px  # 只有要畫圖時才載入 plotly
+    fig = px.bar(
+        pd.DataFrame(counts, columns=['產業', '漲停家數']),
+        x='漲停家數',
+        y='產業',
+        orientation='h',
+        color='漲停家數',
+        color_continuous_scale='Reds',
+        title="今日漲停產業分佈"
+    )
+    fig.update_layout(height=400)
+    return fig
+
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def build_sector_pie_fig(counts):
+    import plotly.express as px
+    fig = px.pie(
+        pd.DataFrame(counts, columns=['產業', '漲停家數']),
+        values='漲停家數',
+        names='產業',
+        title="產業佔比",
+        hole=0.3
+    )
+    fig.update_layout(height=400)
+    return fig
+
 st.divider()
 st.subheader("🏭 產業分佈視覺化")
 
 if not sector_counts.empty:
+    # 只畫前 N 個產業，其餘併成「其他」，圖表大小不隨零星產業數量膨脹
+    counts = tuple(
+        (sector, int(n)) for sector, n in sector_counts.head(SECTOR_CHART_TOP_N).itertuples(index=False, name=None)
+    )
+    other_count = int(sector_counts['漲停家數'].iloc[SECTOR_CHART_TOP_N:].sum())
+    if other_count:
+        counts += (('其他', other_count),)
     col_chart1, col_chart2 = st.columns([2, 1])
     
     with col_chart1:
         # 長條圖
-        fig = px.bar(
-            sector_counts,
-            x='漲停家數',
-            y='產業',
-            orientation='h',
-            color='漲停家數',
-            color_continuous_scale='Reds',
-            title="今日漲停產業分佈"
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(build_sector_bar_fig(counts), use_container_width=True)
     
     with col_chart2:
         # 圓餅圖
-        fig2 = px.pie(
-            sector_counts,
-            values='漲停家數',
-            names='產業',
-            title="產業佔比",
-            hole=0.3
-        )
-        fig2.update_layout(height=400)
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(build_sector_pie_fig(counts), use_container_width=True)
 
 # ========== 今日漲停股票列表 ==========
 st.divider()
@@ -214,13 +202,11 @@ if not df_limit_ups.empty:
         # 只重命名存在的列
         display_df = display_df.rename(columns={k: v for k, v in col_mapping.items() if k in display_df.columns})
         
-        # 格式化
+        # 格式化：保留數值，交給 column_config 在前端顯示（排序也因此以數值進行）
         if '漲幅' in display_df.columns:
-            display_df['漲幅'] = display_df['漲幅'].apply(lambda x: f"{x:.2%}" if pd.notnull(x) else "N/A")
-        if '價格' in display_df.columns:
-            display_df['價格'] = display_df['價格'].apply(lambda x: f"{x:.2f}" if pd.notnull(x) else "N/A")
+            display_df['漲幅'] = display_df['漲幅'] * 100
         if '是否興櫃' in display_df.columns:
-            display_df['是否興櫃'] = display_df['是否興櫃'].apply(lambda x: "✓" if x else "✗")
+            display_df['是否興櫃'] = display_df['是否興櫃'].fillna(False).astype(bool)
         
         # 排序
         sort_cols = []
@@ -236,78 +222,95 @@ if not df_limit_ups.empty:
             display_df,
             use_container_width=True,
             hide_index=True,
+            column_config={
+                "漲幅": st.column_config.NumberColumn("漲幅", format="%.2f%%"),
+                "價格": st.column_config.NumberColumn("價格", format="NT$%.2f"),
+                "是否興櫃": st.column_config.CheckboxColumn(),
+            },
             height=500
         )
 
 # ========== 準備分析資料 ==========
-# 統計連板情況
-consecutive_stats = {}
-if 'consecutive_days' in df_limit_ups.columns:
-    for _, row in df_limit_ups.iterrows():
-        days = row.get('consecutive_days', 1)
-        if pd.notnull(days):
-            consecutive_stats[int(days)] = consecutive_stats.get(int(days), 0) + 1
-
-if consecutive_stats:
-    stats_text = "\n".join([
-        f"- {days}連板：{count}家" 
-        for days, count in sorted(consecutive_stats.items())
-    ])
-else:
-    stats_text = "- 無連板數據"
-
-# 產業分布文字
-if not sector_counts.empty:
-    sector_text = "\n".join([
-        f"- {sector}: {count}家" 
-        for sector, count in sector_counts.head(10).itertuples(index=False)
-    ])
-else:
-    sector_text = "- 無產業數據"
-
-# 最強股票
-if 'consecutive_days' in df_limit_ups.columns and not df_limit_ups.empty:
-    strongest_stocks = df_limit_ups.nlargest(3, 'consecutive_days')
-    strongest_text = "\n".join([
-        f"{i+1}. {row['stock_name'] if 'stock_name' in row else row['symbol']}({row.get('symbol', 'N/A')}): {row['consecutive_days']}連板"
-        for i, (_, row) in enumerate(strongest_stocks.iterrows())
-    ])
-else:
-    strongest_text = "無連板數據"
-
-# 將 DataFrame 轉換為 markdown 表格的輔助函數
-def df_to_markdown_table(df):
-    """將 DataFrame 轉換為 markdown 表格字符串"""
-    if df.empty:
-        return "| 欄位 | 值 |\n| --- | --- |\n| 無數據 | N/A |"
-    
-    # 創建表頭
-    headers = "| " + " | ".join(df.columns) + " |\n"
-    # 創建分隔線
-    separators = "| " + " | ".join(["---"] * len(df.columns)) + " |\n"
-    # 創建數據行
-    rows = ""
-    for _, row in df.iterrows():
-        rows += "| " + " | ".join(str(val) for val in row.values) + " |\n"
-    return headers + separators + rows
-
-# ========== 數據準備區：獲取完整並排序的表格 ==========
-if not df_limit_ups.empty:
-    display_cols = []
-    # 定義 AI 核心分析所需的關鍵欄位
-    for col in ['stock_name', 'symbol', 'sector', 'consecutive_days']:
-        if col in df_limit_ups.columns:
-            display_cols.append(col)
+@st.cache_data(max_entries=16, hash_funcs=FRAME_HASH_FUNCS)
+def build_market_prompt(df_limit_ups, sector_counts, version, market_prompt_template,
+                        total_stocks, main_count, rotc_count, avg_consecutive, avg_return):
+    """
+    組合市場分析提示詞（數 KB 字串 + 完整股票表格）
+    DataFrame 只以輕量指紋雜湊，資料版本與模板相同時直接沿用快取，不在每次 rerun 重組
+    """
+    # 統計連板情況
+    consecutive_stats = {}
+    if 'consecutive_days' in df_limit_ups.columns:
+        counts = df_limit_ups['consecutive_days'].dropna().astype(int).value_counts()
+        consecutive_stats = {int(days): int(count) for days, count in counts.items()}
+
+    if consecutive_stats:
+        stats_text = "\n".join([
+            f"- {days}連板：{count}家" 
+            for days, count in sorted(consecutive_stats.items())
+        ])
+    else:
+        stats_text = "- 無連板數據"
+
+    # 產業分布文字
+    if not sector_counts.empty:
+        # pandas 向量化字串串接，不逐列格式化
+        top_sectors = sector_counts.head(10)
+        sector_text = (
+            "- " + top_sectors['產業'].astype(str) + ": " + top_sectors['漲停家數'].astype(str) + "家"
+        ).str.cat(sep="\n")
+    else:
+        sector_text = "- 無產業數據"
+
+    # 最強股票
+    if 'consecutive_days' in df_limit_ups.columns and not df_limit_ups.empty:
+        strongest_stocks = df_limit_ups.nlargest(3, 'consecutive_days')
+        name_col = 'stock_name' if 'stock_name' in strongest_stocks.columns else 'symbol'
+        ranks = pd.Series(range(1, len(strongest_stocks) + 1), index=strongest_stocks.index).astype(str)
+        strongest_text = (
+            ranks + ". " + strongest_stocks[name_col].astype(str)
+            + "(" + strongest_stocks['symbol'].astype(str) + "): "
+            + strongest_stocks['consecutive_days'].astype(str) + "連板"
+        ).str.cat(sep="\n")
+    else:
+        strongest_text = "無連板數據"
+
+    # ========== 數據準備區：獲取完整並排序的表格 ==========
+    if not df_limit_ups.empty:
+        display_cols = []
+        # 定義 AI 核心分析所需的關鍵欄位
+        for col in ['stock_name', 'symbol', 'sector', 'consecutive_days']:
+            if col in df_limit_ups.columns:
+                display_cols.append(col)
     
-    if display_cols:
-        # 修正：依「連板天數」排序，且不使用 .head(10)，提供完整數據
-        full_stocks_sorted = df_limit_ups.sort_values(by='consecutive_days', ascending=False)[display_cols]
-        # 修正：將完整清單轉換為 Markdown 表格
-        stock_table = df_to_markdown_table(full_stocks_sorted)
+        if display_cols:
+            # 修正：依「連板天數」排序，且不使用 .head(10)，提供完整數據
+            full_stocks_sorted = df_limit_ups.sort_values(by='consecutive_days', ascending=False)[display_cols]
+            # 修正：將完整清單轉換為 Markdown 表格
+            stock_table = df_to_markdown_table(
+                full_stocks_sorted, empty_placeholder="| 欄位 | 值 |\n| --- | --- |\n| 無數據 | N/A |")
+        else:
+            stock_table = "無股票數據"
     else:
         stock_table = "無股票數據"
-else:
-    stock_table = "無股票數據"
+
+    # 計算市場溫度
+    market_temp = '熱絡' if total_stocks > 20 else '溫和' if total_stocks > 10 else '冷清'
+
+    # 格式化提示詞
+    return market_prompt_template.format(
+        today=today,
+        total_stocks=total_stocks,
+        market_temp=market_temp,
+        main_count=main_count,
+        rotc_count=rotc_count,
+        avg_consecutive=f"{avg_consecutive:.1f}",
+        avg_return=f"{avg_return:.2%}",
+        stats_text=stats_text,
+        sector_text=sector_text,
+        strongest_text=strongest_text,
+        stock_table=stock_table  # 這裡現在會填入排序後的「完整清單」
+    )
 
 # ========== 定義提示詞模板 ==========
 try:
@@ -381,22 +384,9 @@ except Exception as e:
 用數據支持觀點，避免主觀臆測。"""
 
 # ========== 格式化提示詞：確保數據正確填入 ==========
-# 計算市場溫度
-market_temp = '熱絡' if total_stocks > 20 else '溫和' if total_stocks > 10 else '冷清'
-
-# 格式化提示詞
-market_prompt = market_prompt_template.format(
-    today=today,
-    total_stocks=total_stocks,
-    market_temp=market_temp,
-    main_count=main_count,
-    rotc_count=rotc_count,
-    avg_consecutive=f"{avg_consecutive:.1f}",
-    avg_return=f"{avg_return:.2%}",
-    stats_text=stats_text,
-    sector_text=sector_text,
-    strongest_text=strongest_text,
-    stock_table=stock_table  # 這裡現在會填入排序後的「完整清單」
+market_prompt = build_market_prompt(
+    df_limit_ups, sector_counts, data_version, market_prompt_template,
+    total_stocks, main_count, rotc_count, avg_consecutive, avg_return
 )
 
 # ========== AI 分析區域 ==========
@@ -416,7 +406,7 @@ st.subheader("🚀 一鍵AI分析")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    encoded_prompt = urllib.parse.quote(market_prompt)
+    encoded_prompt = encode_prompt(market_prompt)
     st.link_button(
         "🔥 ChatGPT 分析",
         f"https://chatgpt.com/?q={encoded_prompt}",
@@ -441,25 +431,26 @@ with col3:
     )
 
 with col4:
-    # Gemini內建診斷（密碼保護）
+    # Gemini內建診斷（密碼保護），解鎖成功就地換成分析按鈕
+    gemini_slot = st.empty()
     if not st.session_state.gemini_authorized:
-        st.markdown('<div class="password-protected">', unsafe_allow_html=True)
-        auth_pw = st.text_input("授權密碼：", type="password", key="market_gemini_pw", label_visibility="collapsed")
-        if st.button("解鎖 Gemini", key="market_gemini_auth", use_container_width=True):
-            if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
-                st.session_state.gemini_authorized = True
-                st.success("✅ 授權成功！")
-                st.rerun()
-            else:
-                st.error("密碼錯誤")
-        st.markdown('</div>', unsafe_allow_html=True)
-    else:
-        if st.button("🤖 Gemini 分析", use_container_width=True):
-            with st.spinner("Gemini正在分析市場中..."):
-                ai_response = call_ai_safely(market_prompt, gemini_model)
-                if ai_response:
-                    st.session_state["ai_response_market"] = ai_response
-                    st.rerun()
+        with gemini_slot.container():
+            st.markdown('<div class="password-protected">', unsafe_allow_html=True)
+            auth_pw = st.text_input("授權密碼：", type="password", key="market_gemini_pw", label_visibility="collapsed")
+            if st.button("解鎖 Gemini", key="market_gemini_auth", use_container_width=True):
+                if auth_pw == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
+                    st.session_state.gemini_authorized = True
+                else:
+                    st.error("密碼錯誤")
+            st.markdown('</div>', unsafe_allow_html=True)
+    if st.session_state.gemini_authorized:
+        with gemini_slot.container():
+            if st.button("🤖 Gemini 分析", use_container_width=True):
+                with st.spinner("Gemini正在分析市場中..."):
+                    ai_response = call_ai_safely(market_prompt, gemini_model, kind="market")
+                    if ai_response:
+                        st.session_state["ai_response_market"] = ai_response
+                        st.rerun()
 
 st.markdown("</div>", unsafe_allow_html=True)
 
@@ -468,28 +459,8 @@ if "ai_response_market" in st.session_state:
     st.divider()
     with st.expander("🤖 Gemini 市場分析報告", expanded=True):
         ai_response = st.session_state["ai_response_market"]
-        st.markdown(
-            f"""
-            <div style="
-                background-color: #f8f9fa !important;
-                padding: 30px !important;
-                border-radius: 15px !important;
-                border-left: 8px solid #28a745 !important;
-                box-shadow: 0 6px 20px rgba(0,0,0,0.12) !important;
-                line-height: 2 !important;
-                font-size: 17px !important;
-                white-space: pre-wrap !important;
-                word-wrap: break-word !important;
-                max-width: 100% !important;
-                width: 100% !important;
-                box-sizing: border-box !important;
-                margin: 10px 0 !important;
-            ">
-            {ai_response.replace('\n', '<br>')}
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+        with st.container(key="ai_report"):
+            st.markdown(ai_response)
         report_text = f"# 市場總覽AI分析報告\n\n日期：{today}\n\n{ai_response}"
         st.download_button(
             label="📥 下載分析報告 (.md)",
@@ -516,4 +487,4 @@ with res_col3:
 with res_col4:
     st.page_link("https://www.wantgoo.com/", label="玩股網總覽", icon="📊")
 
-st.caption(f"市場總覽AI分析頁面 | 更新時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+st.caption(f"市場總覽AI分析頁面 | 更新時間：{taiwan_now.strftime('%Y-%m-%d %H:%M:%S')}")
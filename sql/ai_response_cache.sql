@@ -0,0 +1,10 @@
+-- AI 回應快取：鍵與效期由 ai_cache.py 產生（模型 + 模板版本 + 提示詞的 SHA-256），監控程式與頁面共用
+create table if not exists ai_response_cache (
+    hash        text primary key,
+    response    text not null,
+    created_at  timestamptz not null default now(),
+    expires_at  timestamptz not null
+);
+
+create index if not exists ai_response_cache_expires_at_idx
+    on ai_response_cache (expires_at);
@@ -0,0 +1,19 @@
+-- AI 語意快取：產業/市場分析的提示詞向量與回應，同 scope 內相似度夠高的新提示詞直接沿用
+-- scope：產業分析為產業名稱、市場總結為日期
+create table if not exists ai_semantic_cache (
+    id          bigserial primary key,
+    kind        text not null,
+    model       text not null,
+    scope       text not null default '',
+    embedding   jsonb not null,
+    response    text not null,
+    created_at  timestamptz not null default now(),
+    expires_at  timestamptz not null
+);
+
+-- 已建立過舊版資料表時補上 scope 欄位
+alter table ai_semantic_cache add column if not exists scope text not null default '';
+
+drop index if exists ai_semantic_cache_lookup_idx;
+create index if not exists ai_semantic_cache_lookup_idx
+    on ai_semantic_cache (kind, model, scope, expires_at);
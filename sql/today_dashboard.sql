@@ -0,0 +1,25 @@
+-- 主頁概覽：一次往返取回今日前 10 檔（依漲幅）與統計數字，由資料庫端完成彙總
+create or replace function today_dashboard(d date)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'top10', (
+            select coalesce(json_agg(t), '[]'::json)
+            from (
+                select stock_name, symbol, sector, return_rate, price
+                from individual_stock_analysis
+                where analysis_date = d
+                order by return_rate desc nulls last
+                limit 10
+            ) t
+        ),
+        'total',      count(*),
+        'rotc',       count(*) filter (where is_rotc),
+        'avg_days',   avg(consecutive_days),
+        'avg_return', avg(return_rate)
+    )
+    from individual_stock_analysis
+    where analysis_date = d;
+$$;
@@ -1,13 +1,37 @@
 # utils/__init__.py
 from .utils import (
+    TAIWAN_TZ,
+    get_taiwan_now,
+    get_taiwan_today,
     init_supabase,
-    init_gemini,
     init_connections,
     fetch_today_data,
+    fetch_today_tables,
+    prefetch_today_tables,
+    collect_today_tables,
+    prefetch_today_dashboard,
+    collect_today_dashboard,
+    summarize_limit_ups,
+    render_status_table,
+    render_cache_tools,
+    clear_data_caches,
+    inject_css,
     get_wantgoo_url,
     get_goodinfo_url,
     get_cnyes_url,
     get_stock_links,
+    build_links,
+    df_to_markdown_table,
+    encode_prompt,
+    build_top10_df,
+    get_data_version,
+    FRAME_HASH_FUNCS,
+    build_sector_index,
+    build_sector_counts,
+    build_display_df
+)
+from .ai import (
+    init_gemini,
     call_ai_safely
 )
 
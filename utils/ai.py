@@ -0,0 +1,146 @@
+# utils/ai.py
+import streamlit as st
+from pathlib import Path
+from datetime import datetime, timezone
+
+# 快取鍵與效期與監控程式共用（專案根目錄的 ai_cache.py，不依賴 streamlit）
+from ai_cache import AI_CACHE_TABLE, cache_key, cache_expires_at
+from .utils import init_supabase
+from .rate_limit import gemini_bucket, call_with_backoff
+
+# google.generativeai 會連帶載入 protobuf/grpc，一律在函式內才匯入，不拖慢頁面首次繪製
+
+def _not_found_error():
+    """Gemini 模型不存在時拋出的例外類別（只在真的發生例外時才匯入）"""
+    try:
+        from google.api_core.exceptions import NotFound
+        return NotFound
+    except ImportError:
+        return Exception
+
+# 預設模型與偵測失敗時的候選順序
+DEFAULT_GEMINI_MODEL = "models/gemini-1.5-flash"
+GEMINI_MODEL_CANDIDATES = ['models/gemini-1.5-flash', 'gemini-1.5-flash', 'models/gemini-1.5-pro']
+# 偵測到的模型名稱存放處，下次冷啟動直接沿用
+GEMINI_MODEL_FILE = Path(".streamlit") / "gemini_model.txt"
+
+
+
+def get_gemini_model_name():
+    """
+    目前會話使用的模型名稱，優先順序：
+    會話中偵測過的 > secrets 的 GEMINI_MODEL > 上次偵測存下的檔案 > 預設值
+    """
+    if "gemini_model_name" in st.session_state:
+        return st.session_state["gemini_model_name"]
+    try:
+        configured = st.secrets.get("GEMINI_MODEL")
+    except Exception:
+        configured = None
+    if configured:
+        return configured
+    try:
+        saved = GEMINI_MODEL_FILE.read_text(encoding="utf-8").strip()
+    except OSError:
+        saved = ""
+    return saved or DEFAULT_GEMINI_MODEL
+
+@st.cache_resource
+def discover_gemini_model():
+    """
+    列出可用模型並依候選順序挑選；只在目前模型回傳 404 時才會呼叫
+    結果寫入 GEMINI_MODEL_FILE，伺服器重啟後不必再偵測一次
+    """
+    import google.generativeai as genai
+    available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+    available_set = set(available_models)
+    model_name = next((c for c in GEMINI_MODEL_CANDIDATES if c in available_set),
+                      available_models[0] if available_models else 'gemini-pro')
+    try:
+        GEMINI_MODEL_FILE.parent.mkdir(parents=True, exist_ok=True)
+        GEMINI_MODEL_FILE.write_text(model_name, encoding="utf-8")
+    except OSError:
+        pass  # 唯讀環境（如 Streamlit Cloud）寫不進去也沒關係
+    return model_name
+
+@st.cache_resource
+def init_gemini(model_name=DEFAULT_GEMINI_MODEL):
+    """直接建立模型物件，不在冷啟動時呼叫 list_models()"""
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+        return genai.GenerativeModel(model_name)
+    except Exception as e:
+        st.error(f"AI 初始化失敗: {e}")
+        return None
+
+def stream_text(prompt):
+    """以串流方式呼叫 Gemini，回傳逐段文字的產生器；404 時同樣改用偵測到的模型"""
+    gemini_model = init_gemini(get_gemini_model_name())
+    if not gemini_model:
+        raise RuntimeError("AI 客戶端未啟動")
+    try:
+        response = call_with_backoff(gemini_bucket, gemini_model.generate_content, prompt, stream=True)
+    except _not_found_error():
+        model_name = discover_gemini_model()
+        st.session_state["gemini_model_name"] = model_name
+        response = call_with_backoff(gemini_bucket, init_gemini(model_name).generate_content, prompt, stream=True)
+    return (chunk.text for chunk in response if chunk.text)
+
+def _read_ai_cache(supabase_client, prompt_hash):
+    """查詢未過期的快取回應，查無或失敗時回傳 None"""
+    try:
+        res = supabase_client.table(AI_CACHE_TABLE).select("response")\
+            .eq("hash", prompt_hash)\
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+            .limit(1)\
+            .execute()
+        if res.data:
+            return res.data[0]["response"]
+    except Exception:
+        pass  # 快取表不存在或查詢失敗時，直接改呼叫 AI
+    return None
+
+def _write_ai_cache(supabase_client, prompt_hash, kind, text):
+    """把 AI 回應寫回快取表，失敗不影響主流程；效期依分析類型與台股交易時段（見 ai_cache.py）"""
+    now = datetime.now(timezone.utc)
+    try:
+        supabase_client.table(AI_CACHE_TABLE).upsert({
+            "hash": prompt_hash,
+            "response": text,
+            "created_at": now.isoformat(),
+            "expires_at": cache_expires_at(kind, now).isoformat(),
+        }).execute()
+    except Exception:
+        pass
+
+def call_ai_safely(prompt, gemini_model, kind="individual"):
+    """
+    安全地調用 AI API（相同模型與提示詞會命中快取，與監控程式共用）
+    快取未命中時以串流方式邊生成邊顯示，縮短使用者看到第一段文字的等待時間
+    kind: 'individual' / 'sector' / 'market'，決定快取效期
+    """
+    if not gemini_model:
+        st.error("AI 客戶端未啟動")
+        return None
+
+    try:
+        supabase_client = init_supabase()
+        if supabase_client:
+            cached = _read_ai_cache(supabase_client, cache_key(prompt, get_gemini_model_name()))
+            if cached:
+                return cached
+
+        text = st.write_stream(stream_text(prompt))
+
+        if supabase_client and text:
+            # 串流時若因 404 改用偵測到的模型，寫回的鍵要用實際產生回應的模型
+            _write_ai_cache(supabase_client, cache_key(prompt, get_gemini_model_name()), kind, text)
+        return text
+    except Exception as e:
+        err_msg = str(e)
+        if "429" in err_msg or "ResourceExhausted" in err_msg:
+            st.error("⚠️ AI 額度已耗盡。請稍候 1 分鐘再試，或複製 Prompt 手動貼至 ChatGPT。")
+        else:
+            st.error(f"❌ AI 呼叫失敗: {e}")
+        return None
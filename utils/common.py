@@ -1,50 +1,26 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-from supabase import create_client
 import pandas as pd
-from datetime import datetime, timedelta
-import google.generativeai as genai
-import urllib.parse
+from datetime import timedelta
+import sys
+import os
 
 # 設定頁面配置
 st.set_page_config(page_title="個股AI分析 | Alpha-Refinery", layout="wide")
 
-# 自訂CSS樣式
-st.markdown("""
-    <style>
-    .stMetric { background-color: #ffffff; padding: 15px; border-radius: 10px; border: 1px solid #f0f2f6; box-shadow: 2px 2px 5px rgba(0,0,0,0.05); }
-    .ai-section { background-color: #fff3cd; padding: 15px; border-radius: 8px; border-left: 5px solid #ffc107; }
-    .stock-card { border: 1px solid #e0e0e0; border-radius: 8px; padding: 12px; margin: 8px 0; background: linear-gradient(135deg, #f5f7fa 0%, #e4edf5 100%); }
-    .password-protected { border: 2px solid #ff6b6b; border-radius: 8px; padding: 15px; background-color: #fff5f5; }
-    </style>
-""", unsafe_allow_html=True)
-
 # ========== 1. 初始化連線 ==========
-@st.cache_resource
-def init_supabase():
-    try:
-        return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
-    except Exception as e:
-        st.error(f"Supabase 連線失敗: {e}")
-        return None
-
-@st.cache_resource
-def init_gemini():
-    """自動偵測可用模型，解決 404 與 429 錯誤處理"""
-    try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        candidates = ['models/gemini-1.5-flash', 'gemini-1.5-flash', 'models/gemini-1.5-pro']
-        target_model = next((c for c in candidates if c in available_models), available_models[0] if available_models else 'gemini-pro')
-        return genai.GenerativeModel(target_model)
-    except Exception as e:
-        st.error(f"AI 初始化失敗: {e}")
-        return None
-
-supabase = init_supabase()
-gemini_model = init_gemini()
-today = datetime.now().strftime("%Y-%m-%d")
-yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+# 添加專案根目錄到路徑，確保 utils 指向套件而非本資料夾內的 utils.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import init_connections, get_taiwan_now, fetch_today_data, call_ai_safely, inject_css, encode_prompt
+
+# 自訂CSS樣式（見 assets/）
+inject_css("base", "report")
+
+supabase, gemini_model = init_connections()
+taiwan_now = get_taiwan_now()
+today = taiwan_now.strftime("%Y-%m-%d")
+yesterday = (taiwan_now - timedelta(days=1)).strftime("%Y-%m-%d")
 
 # ========== 2. 密碼保護機制 ==========
 if 'gemini_authorized' not in st.session_state:
@@ -63,32 +39,6 @@ def get_cnyes_url(symbol):
     code = str(symbol).split('.')[0]
     return f"https://www.cnyes.com/twstock/{code}/"
 
-def call_ai_safely(prompt):
-    if not gemini_model:
-        st.error("AI 客戶端未啟動")
-        return None
-
-    try:
-        with st.spinner("🤖 AI 正在深度思考中..."):
-            res = gemini_model.generate_content(prompt)
-            return res.text
-    except Exception as e:
-        err_msg = str(e)
-        if "429" in err_msg or "ResourceExhausted" in err_msg:
-            st.error("⚠️ AI 額度已耗盡。請稍候 1 分鐘再試，或複製 Prompt 手動貼至 ChatGPT。")
-        else:
-            st.error(f"❌ AI 呼叫失敗: {e}")
-        return None
-
-@st.cache_data(ttl=600)
-def fetch_today_data(table_name, date_str):
-    try:
-        res = supabase.table(table_name).select("*").eq("analysis_date", date_str).execute()
-        return pd.DataFrame(res.data) if res.data else pd.DataFrame()
-    except Exception as e:
-        st.error(f"載入數據失敗: {e}")
-        return pd.DataFrame()
-
 # ========== 4. 數據載入 ==========
 if supabase:
     df_limit_ups = fetch_today_data("individual_stock_analysis", today)
@@ -97,7 +47,7 @@ else:
 
 # ========== 5. 頁面標題 ==========
 st.title("📈 個股AI分析")
-st.caption(f"📅 分析日期：{today} | 🕐 最後更新：{datetime.now().strftime('%H:%M:%S')}")
+st.caption(f"📅 分析日期：{today} | 🕐 最後更新：{taiwan_now.strftime('%H:%M:%S')}")
 
 if not supabase:
     st.error("❌ 資料庫連線失敗，請檢查 Supabase 設定")
@@ -108,29 +58,25 @@ if not df_limit_ups.empty:
     # 股票選擇器
     st.header("🔍 選擇分析標的")
 
-    # 建立股票選項
-    stock_options = []
+    # 建立股票選項（顯示文字 -> 股票資料，選取後直接查表）
+    stock_options = {}
     for _, row in df_limit_ups.iterrows():
         display_text = f"{row['stock_name']} ({row['symbol']}) - {row['sector']}"
         # 如果有連板天數，顯示
         if 'consecutive_days' in row and row['consecutive_days'] > 1:
             display_text += f" - {row['consecutive_days']}連板"
-        stock_options.append((display_text, row))
+        stock_options[display_text] = row
 
     # 下拉選單
     selected_display = st.selectbox(
         "選擇股票：",
-        options=[so[0] for so in stock_options],
+        options=list(stock_options),
         index=0,
         help="選擇您要分析的漲停板股票"
     )
 
     # 找到選擇的股票
-    selected_stock = None
-    for display, stock in stock_options:
-        if display == selected_display:
-            selected_stock = stock
-            break
+    selected_stock = stock_options.get(selected_display)
 
     if selected_stock is not None:
         st.markdown('<div class="stock-card">', unsafe_allow_html=True)
@@ -169,24 +115,26 @@ if not df_limit_ups.empty:
         st.divider()
         st.header("🤖 AI深度分析")
 
-        # 密碼保護
+        # 密碼保護：解鎖成功時清掉鎖定畫面、同一輪接著畫分析區，不整頁 rerun
         if not st.session_state.gemini_authorized:
-            st.markdown('<div class="password-protected">', unsafe_allow_html=True)
-            st.warning("🔒 AI分析需要授權解鎖")
-
-            auth_col1, auth_col2 = st.columns([3, 1])
-            with auth_col1:
-                password_input = st.text_input("授權密碼：", type="password", key="stock_analysis_pw")
-            with auth_col2:
-                if st.button("解鎖 AI", use_container_width=True):
-                    if password_input == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
-                        st.session_state.gemini_authorized = True
-                        st.success("✅ 授權成功！")
-                        st.rerun()
-                    else:
-                        st.error("❌ 密碼錯誤")
-            st.markdown('</div>', unsafe_allow_html=True)
-        else:
+            auth_slot = st.empty()
+            with auth_slot.container():
+                st.markdown('<div class="password-protected">', unsafe_allow_html=True)
+                st.warning("🔒 AI分析需要授權解鎖")
+
+                auth_col1, auth_col2 = st.columns([3, 1])
+                with auth_col1:
+                    password_input = st.text_input("授權密碼：", type="password", key="stock_analysis_pw")
+                with auth_col2:
+                    if st.button("解鎖 AI", use_container_width=True):
+                        if password_input == st.secrets.get("AI_ASK_PASSWORD", "default_password"):
+                            st.session_state.gemini_authorized = True
+                        else:
+                            st.error("❌ 密碼錯誤")
+                st.markdown('</div>', unsafe_allow_html=True)
+            if st.session_state.gemini_authorized:
+                auth_slot.empty()
+        if st.session_state.gemini_authorized:
             st.success("✅ Gemini API 已授權")
 
             # 創建提示詞
@@ -246,7 +194,7 @@ if not df_limit_ups.empty:
             col_a1, col_a2, col_a3, col_a4 = st.columns(4)
 
             with col_a1:
-                encoded_prompt = urllib.parse.quote(prompt)
+                encoded_prompt = encode_prompt(prompt)
                 st.link_button("🔥 ChatGPT 分析", f"https://chatgpt.com/?q={encoded_prompt}", use_container_width=True)
 
             with col_a2:
@@ -258,7 +206,7 @@ if not df_limit_ups.empty:
             with col_a4:
                 if st.button("🤖 Gemini 分析", use_container_width=True, type="primary"):
                     with st.spinner("Gemini正在分析中..."):
-                        ai_response = call_ai_safely(prompt)
+                        ai_response = call_ai_safely(prompt, gemini_model)
                         if ai_response:
                             st.session_state.gemini_stock_report = ai_response
                             st.rerun()
@@ -267,28 +215,8 @@ if not df_limit_ups.empty:
             if 'gemini_stock_report' in st.session_state:
                 with st.expander("🤖 Gemini 個股分析報告", expanded=True):
                     ai_response = st.session_state.gemini_stock_report
-                    st.markdown(
-                        f"""
-                        <div style="
-                            background-color: #f8f9fa !important;
-                            padding: 30px !important;
-                            border-radius: 15px !important;
-                            border-left: 8px solid #28a745 !important;
-                            box-shadow: 0 6px 20px rgba(0,0,0,0.12) !important;
-                            line-height: 2 !important;
-                            font-size: 17px !important;
-                            white-space: pre-wrap !important;
-                            word-wrap: break-word !important;
-                            max-width: 100% !important;
-                            width: 100% !important;
-                            box-sizing: border-box !important;
-                            margin: 10px 0 !important;
-                        ">
-                        {ai_response.replace('\n', '<br>')}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    with st.container(key="ai_report"):
+                        st.markdown(ai_response)
                     report_text = f"# {selected_stock['stock_name']} AI分析報告\n\n日期：{today}\n\n{ai_response}"
                     st.download_button(
                         label="📥 下載分析報告 (.md)",
@@ -0,0 +1,61 @@
+# utils/rate_limit.py
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    權杖桶限流：最多累積 capacity 個權杖，每秒補充 refill_rate 個
+    acquire() 取不到權杖時會等待，讓尖峰時段的外部呼叫平滑送出
+    """
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.refill_rate
+            time.sleep(wait)
+
+
+# Gemini 免費額度約每分鐘 15 次；Supabase 讀取較寬鬆
+gemini_bucket = TokenBucket(capacity=5, refill_rate=0.25)
+supabase_bucket = TokenBucket(capacity=20, refill_rate=10)
+
+RETRY_ATTEMPTS = 4
+RETRY_MAX_WAIT = 8.0
+
+
+def is_retryable(exc):
+    """429 額度耗盡與 5xx 伺服器錯誤可以重試；其他錯誤直接拋出"""
+    msg = str(exc)
+    if "429" in msg or "ResourceExhausted" in msg:
+        return True
+    code = getattr(exc, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def call_with_backoff(bucket, func, *args, **kwargs):
+    """先向權杖桶取得配額再呼叫 func；可重試的錯誤以指數退避（0.5s 起、上限 8s）重試"""
+    for attempt in range(RETRY_ATTEMPTS):
+        bucket.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+            time.sleep(min(RETRY_MAX_WAIT, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0))
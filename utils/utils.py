@@ -1,53 +1,279 @@
 # utils/utils.py
 import streamlit as st
-from supabase import create_client
-import google.generativeai as genai
 import pandas as pd
-from datetime import datetime, timedelta
+import pytz
+import json
+import time
+import hashlib
+import importlib.util
+import urllib.parse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .rate_limit import supabase_bucket, call_with_backoff
+
+# 台灣時區：所有頁面都以台灣日期作為資料與快取的鍵，避免伺服器時區不同造成錯日
+TAIWAN_TZ = pytz.timezone('Asia/Taipei')
+
+def get_taiwan_now():
+    """返回台灣時間的當前時刻"""
+    return datetime.now(pytz.utc).astimezone(TAIWAN_TZ)
+
+def get_taiwan_today():
+    """返回台灣時間的今日日期字串 (YYYY-MM-DD)"""
+    return get_taiwan_now().strftime("%Y-%m-%d")
+
+def _supabase_options():
+    """
+    共用一個保持連線的 httpx.Client（有安裝 h2 時啟用 HTTP/2 多工），
+    讓並行查詢重用同一條連線；舊版 supabase-py 不支援 httpx_client 時回傳 None
+    """
+    try:
+        import httpx
+        from supabase.lib.client_options import SyncClientOptions
+        http_client = httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        return SyncClientOptions(httpx_client=http_client)
+    except (ImportError, TypeError):
+        return None
 
 @st.cache_resource
 def init_supabase():
     try:
+        from supabase import create_client  # 延後匯入，縮短頁面首次繪製時間
+        options = _supabase_options()
+        if options is not None:
+            return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"], options=options)
         return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
     except Exception as e:
         st.error(f"Supabase 連線失敗: {e}")
         return None
 
-@st.cache_resource
-def init_gemini():
-    """自動偵測可用模型，解決 404 與 429 錯誤處理"""
+def init_connections():
+    """初始化並返回資料庫和AI模型連線"""
+    from .ai import init_gemini, get_gemini_model_name
+    return init_supabase(), init_gemini(get_gemini_model_name())
+
+# 各資料表頁面實際會用到的欄位；未列出的資料表才退回 select("*")
+TODAY_COLUMNS = {
+    "individual_stock_analysis": "stock_name,symbol,sector,ai_comment,return_rate,price,is_rotc,consecutive_days",
+    "daily_market_summary": "summary_content",
+}
+# 伺服器端排序欄位（降冪），讓「前 N 檔」直接取到漲幅最高者
+TODAY_ORDER_BY = {
+    "individual_stock_analysis": "return_rate",
+}
+# 單次查詢的筆數上限，避免異常資料一次拉回整張表
+TODAY_ROW_LIMIT = 500
+# 盤中資料快取：秒數短以跟上監控寫入；筆數有上限，避免不同日期的鍵無限累積
+TODAY_CACHE_TTL_SECONDS = 60
+TODAY_CACHE_MAX_ENTRIES = 16
+
+# 第二層磁碟快取：新的 Streamlit 程序冷啟動時也不必重打 Supabase
+DISK_CACHE_DIR = Path(".cache")
+# 磁碟快取的檔案數上限：每個 (資料表, 日期) 一個檔案，只保留最近寫入的幾個，長時間運行也不會無限累積
+DISK_CACHE_MAX_FILES = TODAY_CACHE_MAX_ENTRIES
+
+def _disk_cache_path(table_name, date_str):
+    return DISK_CACHE_DIR / f"{table_name}_{date_str}.json"
+
+def _read_disk_cache(table_name, date_str):
+    """讀取磁碟快取；今日資料超過 TTL 視為過期，過去日期的資料不會再變動"""
+    path = _disk_cache_path(table_name, date_str)
     try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        candidates = ['models/gemini-1.5-flash', 'gemini-1.5-flash', 'models/gemini-1.5-pro']
-        target_model = next((c for c in candidates if c in available_models), available_models[0] if available_models else 'gemini-pro')
-        return genai.GenerativeModel(target_model)
-    except Exception as e:
-        st.error(f"AI 初始化失敗: {e}")
+        age = time.time() - path.stat().st_mtime
+        if date_str >= get_taiwan_today() and age > TODAY_CACHE_TTL_SECONDS:
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
         return None
 
-def init_connections():
-    """初始化並返回資料庫和AI模型連線"""
-    return init_supabase(), init_gemini()
+def _prune_disk_cache():
+    """刪除超過 DISK_CACHE_MAX_FILES 的舊快取檔（依修改時間，最舊的先刪）"""
+    try:
+        paths = sorted(DISK_CACHE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for path in paths[DISK_CACHE_MAX_FILES:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def _write_disk_cache(table_name, date_str, records):
+    try:
+        DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _disk_cache_path(table_name, date_str).write_text(
+            json.dumps(records, ensure_ascii=False), encoding="utf-8"
+        )
+    except (OSError, TypeError):
+        return  # 唯讀環境寫不進去就只靠記憶體快取
+    _prune_disk_cache()
+
+@st.cache_resource(ttl=TODAY_CACHE_TTL_SECONDS, max_entries=TODAY_CACHE_MAX_ENTRIES, show_spinner=False)
+def _query_today_records(table_name, date_str):
+    """
+    查詢單一資料表的今日原始 records（不處理例外，交由呼叫端決定）
+    使用 cache_resource：命中時直接回傳記憶體中的 list，省去 cache_data 每次 rerun 的 pickle 往返
+    """
+    records = _read_disk_cache(table_name, date_str)
+    if records is not None:
+        return records
+
+    columns = TODAY_COLUMNS.get(table_name, "*")
+    query = init_supabase().table(table_name).select(columns).eq("analysis_date", date_str)
+    if table_name in TODAY_ORDER_BY:
+        query = query.order(TODAY_ORDER_BY[table_name], desc=True)
+    res = call_with_backoff(supabase_bucket, query.limit(TODAY_ROW_LIMIT).execute)
+    records = res.data or []
+    _write_disk_cache(table_name, date_str, records)
+    return records
+
+# 代碼與名稱改用 Arrow 字串儲存（Streamlit 本身依賴 pyarrow，缺少時退回 pandas 字串型別）
+ARROW_STRING_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else "string"
+ARROW_STRING_COLUMNS = ('symbol', 'stock_name')
+
+def _records_to_frame(records):
+    """
+    records 轉成 DataFrame 並縮小欄位型別（數值降位、is_rotc 轉布林、代碼與名稱轉 Arrow 字串），
+    減少記憶體與送往前端的序列化量；sector / ai_comment 可能為空，維持 object，
+    頁面對單列取值時仍是 None 而非 pd.NA，真假判斷不受影響
+    """
+    df = pd.DataFrame(records)
+    for col in ARROW_STRING_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(ARROW_STRING_DTYPE)
+    for col in ('return_rate', 'price'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='float')
+    if 'consecutive_days' in df.columns:
+        df['consecutive_days'] = pd.to_numeric(df['consecutive_days'], errors='coerce', downcast='integer')
+    if 'is_rotc' in df.columns:
+        df['is_rotc'] = df['is_rotc'].astype('boolean')
+    return df
+
+def _query_today(table_name, date_str):
+    """以快取的 records 建立新的 DataFrame，頁面可自由修改而不影響共用快取"""
+    return _records_to_frame(_query_today_records(table_name, date_str))
 
-@st.cache_data(ttl=600)
 def fetch_today_data(table_name, date_str):
     """
-    獲取今日數據
+    獲取今日數據（原始資料快取 60 秒，見 _query_today_records）
     注意：在函數內部調用 init_supabase()，避免傳遞不可哈希的 supabase 客戶端
     """
-    supabase_client = init_supabase()
-    if not supabase_client:
+    if not init_supabase():
         st.error("Supabase 連線失敗")
         return pd.DataFrame()
-    
+
     try:
-        res = supabase_client.table(table_name).select("*").eq("analysis_date", date_str).execute()
-        return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+        return _query_today(table_name, date_str)
     except Exception as e:
         st.error(f"載入數據失敗: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def _prefetch_pool():
+    """跨 rerun 共用的背景查詢執行緒池"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def prefetch_today_tables(table_names, date_str):
+    """
+    在背景執行緒送出多張資料表的今日查詢並立即返回 futures，
+    頁面可先繪製其他區塊，需要資料時再以 collect_today_tables 取回
+    """
+    pool = _prefetch_pool()
+    return [pool.submit(_query_today_records, t, date_str) for t in table_names]
+
+def collect_today_tables(futures):
+    """等待背景查詢完成，回傳與送出順序相同的 DataFrame tuple"""
+    results = []
+    for future in futures:
+        try:
+            results.append(_records_to_frame(future.result()))
+        except Exception as e:
+            st.error(f"載入數據失敗: {e}")
+            results.append(pd.DataFrame())
+    return tuple(results)
+
+@st.cache_resource(ttl=TODAY_CACHE_TTL_SECONDS, max_entries=TODAY_CACHE_MAX_ENTRIES, show_spinner=False)
+def _query_today_dashboard(date_str):
+    """
+    呼叫 today_dashboard RPC（見 sql/today_dashboard.sql）
+    函式未建立或查詢失敗時直接拋出例外，不讓失敗結果被快取，由 collect_today_dashboard 退回備援
+    """
+    query = init_supabase().rpc("today_dashboard", {"d": date_str})
+    return call_with_backoff(supabase_bucket, query.execute).data
+
+def _mean_or_none(series):
+    """平均值；整欄皆為空值時回傳 None 而不是 NaN，頁面才不會顯示「nan天」"""
+    mean = series.mean()
+    return None if pd.isna(mean) else float(mean)
+
+def summarize_limit_ups(df):
+    """在用戶端算出與 today_dashboard 相同結構的摘要，作為 RPC 不可用時的備援"""
+    if df.empty:
+        return {"top10": [], "total": 0, "rotc": 0, "avg_days": None, "avg_return": None}
+    top_cols = [c for c in ('stock_name', 'symbol', 'sector', 'return_rate', 'price') if c in df.columns]
+    return {
+        "top10": df.head(10)[top_cols].to_dict("records"),
+        "total": len(df),
+        "rotc": int(df['is_rotc'].fillna(False).astype(bool).sum()) if 'is_rotc' in df.columns else 0,
+        "avg_days": _mean_or_none(df['consecutive_days']) if 'consecutive_days' in df.columns else None,
+        "avg_return": _mean_or_none(df['return_rate']) if 'return_rate' in df.columns else None,
+    }
+
+def prefetch_today_dashboard(date_str):
+    """在背景送出 today_dashboard RPC，回傳 future"""
+    return _prefetch_pool().submit(_query_today_dashboard, date_str)
+
+def collect_today_dashboard(future, date_str):
+    """取回概覽摘要；RPC 失敗或沒有結果時退回載入整張漲停表自行計算"""
+    try:
+        dashboard = future.result()
+    except Exception:
+        dashboard = None  # 函式未建立或暫時性錯誤：本次退回備援，下次 rerun 會重試 RPC
+    if not dashboard:
+        dashboard = summarize_limit_ups(fetch_today_data("individual_stock_analysis", date_str))
+    return dashboard
+
+def fetch_today_tables(table_names, date_str):
+    """
+    並行獲取多張資料表的今日數據，頁面載入只需等待一次往返
+    回傳與 table_names 同順序的 DataFrame tuple
+    """
+    if not init_supabase():
+        st.error("Supabase 連線失敗")
+        return tuple(pd.DataFrame() for _ in table_names)
+
+    return collect_today_tables(prefetch_today_tables(table_names, date_str))
+
+# 頁面樣式表目錄（專案根目錄下的 assets/）
+ASSETS_DIR = Path(__file__).resolve().parent.parent / "assets"
+
+@st.cache_resource
+def _load_css(name):
+    """讀取樣式表內容；檔案只在程序內讀一次"""
+    return (ASSETS_DIR / f"{name}.css").read_text(encoding="utf-8")
+
+def inject_css(*names):
+    """
+    依序合併多個樣式表並以單一 <style> 注入
+    每次 rerun 仍需送出（Streamlit 會移除本輪未產生的元素），但不再重複讀檔與組字串
+    """
+    css = "\n".join(_load_css(name) for name in names)
+    st.markdown(f"<style>\n{css}</style>", unsafe_allow_html=True)
+
+def render_status_table(supabase_client, gemini_model, stock_count):
+    """側邊欄系統狀態：合併成一個 markdown 表格，只送出一個元素"""
+    st.markdown(
+        "| Supabase | Gemini | 漲停股票 |\n"
+        "|:--:|:--:|:--:|\n"
+        f"| {'✅' if supabase_client else '❌'} | {'✅' if gemini_model else '❌'} | {stock_count} |"
+    )
+
 def get_wantgoo_url(symbol):
     code = str(symbol).split('.')[0]
     return f"https://www.wantgoo.com/stock/{code}/technical-chart"
@@ -70,20 +296,147 @@ def get_stock_links(symbol):
         "yahoo": f"https://tw.stock.yahoo.com/quote/{code}.TW"
     }
 
-def call_ai_safely(prompt, gemini_model):
-    """安全地調用 AI API"""
-    if not gemini_model:
-        st.error("AI 客戶端未啟動")
-        return None
+def build_links(symbols):
+    """
+    get_wantgoo_url / get_goodinfo_url / get_cnyes_url 的向量化版本
+    代碼只切一次，三個連結欄共用；回傳與 symbols 同索引的 DataFrame
+    """
+    codes = symbols.astype(str).str.split('.', n=1).str[0]
+    return pd.DataFrame({
+        '玩股網K線': 'https://www.wantgoo.com/stock/' + codes + '/technical-chart',
+        'Goodinfo': 'https://goodinfo.tw/tw/StockBZPerformance.asp?STOCK_ID=' + codes,
+        '鉅亨網': 'https://www.cnyes.com/twstock/' + codes + '/',
+    }, index=symbols.index)
 
-    try:
-        with st.spinner("🤖 AI 正在深度思考中..."):
-            res = gemini_model.generate_content(prompt)
-            return res.text
-    except Exception as e:
-        err_msg = str(e)
-        if "429" in err_msg or "ResourceExhausted" in err_msg:
-            st.error("⚠️ AI 額度已耗盡。請稍候 1 分鐘再試，或複製 Prompt 手動貼至 ChatGPT。")
-        else:
-            st.error(f"❌ AI 呼叫失敗: {e}")
+def df_to_markdown_table(df, empty_placeholder=None):
+    """
+    將 DataFrame 轉換為 markdown 表格字符串（提示詞用，不依賴 tabulate）
+    逐欄向量化串接，不逐列建立 Series；空表時回傳 empty_placeholder（未指定則只有表頭）
+    """
+    if df.empty and empty_placeholder is not None:
+        return empty_placeholder
+    headers = "| " + " | ".join(df.columns) + " |\n"
+    separators = "| " + " | ".join(["---"] * len(df.columns)) + " |\n"
+    if df.empty:
+        return headers + separators
+    cells = [df[col].astype(str) for col in df.columns]
+    rows = "| " + cells[0]
+    for cell in cells[1:]:
+        rows = rows + " | " + cell
+    return headers + separators + (rows + " |\n").str.cat()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def encode_prompt(prompt):
+    """提示詞的 URL 編碼（數 KB 文字，內容不變時每次 rerun 都直接沿用）"""
+    return urllib.parse.quote(prompt)
+
+@st.cache_data(ttl=TODAY_CACHE_TTL_SECONDS, max_entries=TODAY_CACHE_MAX_ENTRIES)
+def build_top10_df(records):
+    """
+    主頁前 10 檔表格：依漲幅取前 10（nlargest 只做部分排序）並換成中文欄名
+    保留數值欄位，由前端依 column_config 格式化（漲幅轉成百分點）
+    """
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    display_df = df.nlargest(10, 'return_rate')[['stock_name', 'symbol', 'sector', 'return_rate', 'price']].copy()
+    display_df.columns = ['股票名稱', '代碼', '產業', '漲幅', '價格']
+    display_df['漲幅'] = (display_df['漲幅'] * 100).astype('float32')
+    display_df['價格'] = display_df['價格'].astype('float32')
+    return display_df
+
+# 快取指紋涵蓋的欄位：除了代碼，監控程式事後才補上的 AI 點評與連板天數也要算進去，
+# 否則同一批股票更新點評後仍會命中舊的衍生表格
+FINGERPRINT_COLUMNS = ('symbol', 'ai_comment', 'consecutive_days')
+
+def _content_digest(df):
+    """FINGERPRINT_COLUMNS 的向量化雜湊（pandas 逐列雜湊後取位元組），表格沒有這些欄位時回傳 None"""
+    cols = [c for c in FINGERPRINT_COLUMNS if c in df.columns]
+    if not cols:
         return None
+    row_hashes = pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+def get_data_version(df, date_str):
+    """
+    以日期、筆數與代碼/AI 點評/連板天數的雜湊組成的輕量指紋，作為衍生表格快取的鍵
+    取代 Streamlit 對整張 DataFrame 內容的雜湊
+    """
+    return f"{date_str}:{len(df)}:{_content_digest(df)}"
+
+def frame_fingerprint(df):
+    """
+    cache_data 參數中 DataFrame 的雜湊方式：筆數 + FINGERPRINT_COLUMNS 的雜湊（都沒有就用欄名）
+    只雜湊這幾欄，不逐格走訪整張表
+    """
+    digest = _content_digest(df)
+    if digest is not None:
+        return (len(df), digest)
+    return (len(df), tuple(df.columns))
+
+FRAME_HASH_FUNCS = {pd.DataFrame: frame_fingerprint}
+
+@st.cache_data(max_entries=TODAY_CACHE_MAX_ENTRIES, hash_funcs=FRAME_HASH_FUNCS)
+def build_sector_index(df, version):
+    """
+    產業 -> 該產業股票 DataFrame 的對照表，一次 groupby 建好後以 dict 查詢
+    DataFrame 以 frame_fingerprint 雜湊；缺產業者歸入「未分類」，各頁面取得的索引一致
+    """
+    if 'sector' not in df.columns:
+        return {}
+    return {sector: group for sector, group in df.groupby(df['sector'].fillna('未分類'), sort=False)}
+
+@st.cache_data(max_entries=TODAY_CACHE_MAX_ENTRIES, hash_funcs=FRAME_HASH_FUNCS)
+def build_sector_counts(df, version):
+    """各產業漲停家數（遞減排序），與 build_sector_index 同樣把缺產業歸入「未分類」"""
+    if 'sector' not in df.columns:
+        return pd.Series(dtype='int64')
+    return df['sector'].fillna('未分類').value_counts()
+
+# 列表中 AI 點評的顯示字數（完整內容在個股分析區塊）
+AI_COMMENT_PREVIEW_CHARS = 200
+
+@st.cache_data(max_entries=TODAY_CACHE_MAX_ENTRIES, hash_funcs=FRAME_HASH_FUNCS)
+def build_display_df(df, version):
+    """
+    建立漲停列表的顯示用表格（連結欄位 + 中文欄名）
+    快取鍵為 version（見 get_data_version）與 DataFrame 的輕量指紋，不雜湊整張表內容
+    """
+    df = df.join(build_links(df['symbol']))
+
+    display_df = df[['stock_name', 'symbol', 'sector', 'ai_comment',
+                     '玩股網K線', 'Goodinfo', '鉅亨網']].copy()
+    display_df.columns = ['股票名稱', '代碼', '產業別', 'AI點評',
+                          '📈 K線圖', '📊 財報', '📰 新聞']
+    # 縮小送往前端的 Arrow 資料量：重複值多的欄位轉 category，點評只留前 200 字
+    display_df['產業別'] = display_df['產業別'].astype('category')
+    display_df['代碼'] = display_df['代碼'].astype('category')
+    display_df['AI點評'] = display_df['AI點評'].astype('string').str.slice(0, AI_COMMENT_PREVIEW_CHARS)
+    return display_df
+
+def clear_data_caches():
+    """只清資料快取（記憶體與 .cache 磁碟檔），保留 Supabase 連線與 Gemini 模型"""
+    for cached in (_query_today_records, _query_today_dashboard,
+                   build_top10_df, build_sector_index, build_sector_counts, build_display_df):
+        cached.clear()
+    for path in DISK_CACHE_DIR.glob("*.json"):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def render_cache_tools():
+    """
+    側邊欄維護按鈕：平常只需重新載入資料；
+    連線異常時才連同 Supabase 客戶端與 Gemini 模型一起重建（需重新交握、列模型）
+    """
+    st.subheader("🛠️ 除錯與維護工具")
+    if st.button("🔄 重新載入資料"):
+        clear_data_caches()
+        st.success("資料快取已清除！正在重新載入最新資料...")
+        st.rerun()
+    if st.button("♻️ 重連連線"):
+        clear_data_caches()
+        st.cache_resource.clear()
+        st.success("連線已重建！正在重新載入...")
+        st.rerun()